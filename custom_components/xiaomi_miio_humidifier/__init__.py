@@ -10,20 +10,20 @@ from homeassistant.const import (
 )
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.core import HomeAssistant
-from homeassistant.helpers.update_coordinator import DataUpdateCoordinator
-from homeassistant.exceptions import PlatformNotReady
-from miio import (  # pylint: disable=import-error
-    Device,
-    DeviceException
-)
 
 from .humidifier_miot import HumidifierMiot
+from .miio_async import MiioTransport
+from .coordinator import XiaomiHumidifierDataUpdateCoordinator
 
 from .const import (
+    CONF_DEVICE_INFO,
     CONF_MODEL,
-    DATA_KEY,
+    DATA_COORDINATOR,
+    DATA_DEVICE,
+    DATA_TRANSPORT,
     DOMAIN,
     DOMAINS,
+    MODEL_DMAKER_DERH_22HT,
     MODELS_MIOT
 )
 
@@ -37,15 +37,36 @@ async def async_setup(hass: HomeAssistant, hass_config: dict):
 
 async def async_update_options(hass: HomeAssistant, entry: ConfigEntry):
     """ Update Optioins if available """
+    data = hass.data[DOMAIN].get(entry.options[CONF_HOST])
+    if data is not None and data[DATA_COORDINATOR].async_apply_options(entry.options):
+        return
+
     await hass.config_entries.async_reload(entry.entry_id)
 
 
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry):
     """ check unload integration """
-    return all([
+    unload_ok = all([
         await hass.config_entries.async_forward_entry_unload(entry, domain)
         for domain in DOMAINS
     ])
+    if unload_ok:
+        data = hass.data[DOMAIN].pop(entry.options[CONF_HOST], None)
+        if data is not None:
+            await data[DATA_DEVICE].async_close()
+        if not hass.data[DOMAIN] and DATA_TRANSPORT in hass.data:
+            hass.data.pop(DATA_TRANSPORT).close()
+
+    return unload_ok
+
+
+def _get_transport(hass: HomeAssistant) -> MiioTransport:
+    """Return the UDP socket shared by the devices of all entries."""
+    transport = hass.data.get(DATA_TRANSPORT)
+    if transport is None:
+        transport = hass.data[DATA_TRANSPORT] = MiioTransport()
+
+    return transport
 
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry):
@@ -69,32 +90,22 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry):
         token = entry.options[CONF_TOKEN]
         model = entry.options.get(CONF_MODEL)
 
-    if DATA_KEY not in hass.data:
-        hass.data.setdefault(DATA_KEY, {})
-        hass.data[DATA_KEY][host] = {}
-
     if DOMAIN not in hass.data:
         hass.data[DOMAIN] = {}
 
-    unique_id = None
-
     if model is None:
-        try:
-            miio_device = Device(host, token)
-            device_info = await hass.async_add_executor_job(miio_device.info)
-            model = device_info.model
-            unique_id = f"{model}-{device_info.mac_address}"
-            _LOGGER.info(
-                "%s %s %s detected",
-                model,
-                device_info.firmware_version,
-                device_info.hardware_version,
-            )
-        except DeviceException as ex:
-            raise PlatformNotReady from ex
+        # detected by an earlier run, setup does not wait for the device
+        model = entry.options.get(CONF_DEVICE_INFO, {}).get("model")
+    if model is None:
+        _LOGGER.warning(
+            "The model of %s is not known yet, probing it as %s", host, MODEL_DMAKER_DERH_22HT
+        )
+        model = MODEL_DMAKER_DERH_22HT
 
     if model in MODELS_MIOT:
-        humidifier = HumidifierMiot(host, token)
+        humidifier = HumidifierMiot(
+            host, token, model=model, transport=_get_transport(hass)
+        )
     else:
         _LOGGER.error(
             "Unsupported device found! Please create an issue at "
@@ -104,9 +115,23 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry):
         )
         return False
 
-    hass.data[DOMAIN][host] = humidifier
+    coordinator = XiaomiHumidifierDataUpdateCoordinator(hass, humidifier, host, entry.options)
+    hass.data[DOMAIN][host] = {
+        DATA_DEVICE: humidifier,
+        DATA_COORDINATOR: coordinator
+    }
+
+    # skip the probe and the handshake done by earlier runs, and start the
+    # entities from the last known status
+    await coordinator.async_restore()
+    # one batched status fetch shared by the entities of all platforms, setup
+    # does not wait for it
+    entry.async_create_background_task(
+        hass, coordinator.async_refresh(), f"{DOMAIN} {host} first refresh"
+    )
 
     # init setup for each supported domains
     await hass.config_entries.async_forward_entry_setups(entry, DOMAINS)
+    coordinator.platforms_ready = True
 
     return True
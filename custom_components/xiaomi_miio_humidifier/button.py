@@ -1,7 +1,5 @@
 """Support for Xiaomi Smart Humidifier/Dehumidifier button service."""
 import logging
-from datetime import timedelta
-from functools import partial
 
 from homeassistant.core import HomeAssistant
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
@@ -12,13 +10,14 @@ from homeassistant.components.button import (
     ButtonEntityDescription,
 )
 from homeassistant.const import (
-    CONF_HOST,
-    CONF_TOKEN
+    CONF_HOST
 )
 from miio import DeviceException
 
 from .const import (
     CONF_MODEL,
+    DATA_COORDINATOR,
+    DATA_DEVICE,
     DOMAIN,
     HUMIDIFIER_BUTTONS_V1,
     MODELS_MIOT
@@ -26,8 +25,6 @@ from .const import (
 
 _LOGGER = logging.getLogger(__name__)
 
-SCAN_INTERVAL = timedelta(seconds=30)
-
 async def async_setup_entry(
     hass: HomeAssistant, entry: ConfigType, async_add_entities: AddEntitiesCallback
 ) -> None:
@@ -38,7 +35,8 @@ async def async_setup_entry(
     name = entry.title
     unique_id = entry.unique_id
 
-    humidifier = hass.data[DOMAIN][host]
+    humidifier = hass.data[DOMAIN][host][DATA_DEVICE]
+    coordinator = hass.data[DOMAIN][host][DATA_COORDINATOR]
 
     try:
         entities = []
@@ -47,7 +45,8 @@ async def async_setup_entry(
             for description in HUMIDIFIER_BUTTONS_V1:
                 unique_id = "{}_{}".format(unique_id.replace(" ", "_"), description.key)
                 entities.extend(
-                    [XiaomiHumidifierButton(entry.options, description, name, unique_id, humidifier)]
+                    [XiaomiHumidifierButton(
+                        coordinator, entry.options, description, name, unique_id, humidifier)]
                 )
 
         async_add_entities(entities)
@@ -57,15 +56,16 @@ async def async_setup_entry(
 class XiaomiHumidifierButton(ButtonEntity):
     """Implementation of a Xiaomi Smart Humidifier/Dehumidifier button."""
     entity_description: ButtonEntityDescription
+    _attr_should_poll = False
 
-    def __init__(self, entry_data, description, name, unique_id, humidifier):
+    def __init__(self, coordinator, entry_data, description, name, unique_id, humidifier):
         self.entity_description = description
+        self._coordinator = coordinator
         self._entry_data = entry_data
         self._name = name
         self._model = entry_data[CONF_MODEL]
         self._unique_id = unique_id
         self._attr = description.key
-        self._mac = entry_data[CONF_TOKEN]
         self._host = entry_data[CONF_HOST]
         self._humidifier = humidifier
         self._available = True
@@ -88,34 +88,36 @@ class XiaomiHumidifierButton(ButtonEntity):
     @property
     def device_info(self):
         """Return the device info."""
-        info = self._humidifier.info()
+        info = self._coordinator.info
         device_info = {
             "identifiers": {(DOMAIN, self._unique_id)},
             "manufacturer": (self._model or "Xiaomi").split(".", 1)[0].capitalize(),
             "name": self._name,
-            "model": self._model,
-            "sw_version": info.firmware_version,
-            "hw_version": info.hardware_version
+            "model": self._model
         }
-
-        if self._mac is not None:
-            device_info["connections"] = {(dr.CONNECTION_NETWORK_MAC, self._mac)}
+        if info is not None:
+            device_info["sw_version"] = info.firmware_version
+            device_info["hw_version"] = info.hardware_version
+            if info.mac_address:
+                device_info["connections"] = {(dr.CONNECTION_NETWORK_MAC, info.mac_address)}
 
         return device_info
 
     async def _try_command(self, mask_error, func, *args, **kwargs):
         """Call a humidifier command handling error messages."""
         try:
-            result = await self.hass.async_add_executor_job(
-                partial(func, *args, **kwargs)
-            )
+            result = await func(*args, **kwargs)
 
             if isinstance(result, list):
-                return result[0].get('code', -1) == 0
+                success = result[0].get('code', -1) == 0
             elif isinstance(result, dict):
-                return result.get('code', -1) == 0
+                success = result.get('code', -1) == 0
             else:
-                return False
+                success = False
+            if success:
+                self._coordinator.async_note_command()
+
+            return success
         except DeviceException as exc:
             if self._available:
                 _LOGGER.error(mask_error, exc)
@@ -127,6 +129,6 @@ class XiaomiHumidifierButton(ButtonEntity):
         """Press the button."""
         ret = await self._try_command(
             "Press the humidifier button failed.",
-            self._humidifier.call_action,
+            self._humidifier.async_call_action,
             self._attr)
 
@@ -0,0 +1,102 @@
+"""Write coalescing of the Xiaomi Smart Humidifier/Dehumidifier component."""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+# seconds after a request in which further writes are collected
+WRITE_WINDOW = 0.2
+
+
+class WriteCoalescer:
+    """Merge the property writes of one device made in a short window.
+
+    A write to an idle device is sent right away. Writes made while a request
+    is in flight or within the window after it was sent are collected and
+    sent together in one request once both are over. Writes to a property
+    pending there replace its value, so a burst of target humidity changes
+    sends only the last one. Every writer gets the result of the request
+    which carried the value it was merged into.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]],
+        window: float = WRITE_WINDOW
+    ) -> None:
+        """Initialize the coalescer, send writes values by name and returns results by name."""
+        self._send = send
+        self._window = window
+        self._values: Dict[str, Any] = {}
+        self._waiters: Dict[str, List[asyncio.Future]] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        # loop time until which writes are collected after a request
+        self._window_end = 0.0
+
+    async def async_write(self, name: str, value: Any) -> Any:
+        """Write a property with the next request, return its result."""
+        waiter = asyncio.get_running_loop().create_future()
+        self._values[name] = value
+        self._waiters.setdefault(name, []).append(waiter)
+        self._schedule()
+
+        return await waiter
+
+    def cancel(self) -> None:
+        """Drop the pending writes, their writers get a CancelledError."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        for waiters in self._waiters.values():
+            for waiter in waiters:
+                waiter.cancel()
+        self._values = {}
+        self._waiters = {}
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+
+    def _schedule(self) -> None:
+        """Send the collected writes when the request in flight and the window are over."""
+        if self._timer is not None or self._flush_task is not None or not self._values:
+            return
+
+        loop = asyncio.get_running_loop()
+        # writes made in the same iteration of the loop still share the request
+        self._timer = loop.call_at(max(loop.time(), self._window_end), self._flush)
+
+    def _flush(self) -> None:
+        """Send the collected writes."""
+        loop = asyncio.get_running_loop()
+        self._timer = None
+        self._window_end = loop.time() + self._window
+        values, self._values = self._values, {}
+        waiters, self._waiters = self._waiters, {}
+        self._flush_task = loop.create_task(self._async_send(values, waiters))
+        self._flush_task.add_done_callback(self._flushed)
+
+    def _flushed(self, _task: asyncio.Task) -> None:
+        """Send the writes collected while the request was in flight."""
+        self._flush_task = None
+        self._schedule()
+
+    async def _async_send(
+        self, values: Dict[str, Any], waiters: Dict[str, List[asyncio.Future]]
+    ) -> None:
+        """Send one request and hand its results to the writers."""
+        try:
+            results = await self._send(values)
+        except asyncio.CancelledError:
+            for futures in waiters.values():
+                for waiter in futures:
+                    waiter.cancel()
+            raise
+        except Exception as ex:  # pylint: disable=broad-except
+            for futures in waiters.values():
+                for waiter in futures:
+                    if not waiter.done():
+                        waiter.set_exception(ex)
+            return
+
+        for name, futures in waiters.items():
+            for waiter in futures:
+                if not waiter.done():
+                    waiter.set_result(results.get(name))
@@ -0,0 +1,56 @@
+"""Command queue of the Xiaomi Smart Humidifier/Dehumidifier component."""
+import asyncio
+import heapq
+from contextlib import asynccontextmanager
+from itertools import count
+from typing import AsyncIterator, List, Tuple
+
+# lower runs first, requests of the same priority run in order
+PRIORITY_COMMAND = 0
+PRIORITY_POLL = 1
+PRIORITY_BACKGROUND = 2
+
+
+class CommandQueue:
+    """Let one request at a time talk to a device, the most urgent first.
+
+    Writes and actions are sent before waiting polls, and polls before
+    background requests such as the device info.
+    """
+
+    def __init__(self) -> None:
+        """Initialize the queue."""
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._order = count()
+        self._busy = False
+
+    @asynccontextmanager
+    async def async_slot(self, priority: int) -> AsyncIterator[None]:
+        """Wait for the turn of a request and hold it until the request is done."""
+        if self._busy:
+            waiter = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (priority, next(self._order), waiter))
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                # the turn was handed over just before the cancellation
+                if waiter.done() and not waiter.cancelled():
+                    self._release()
+                raise
+        else:
+            self._busy = True
+
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _release(self) -> None:
+        """Hand the turn to the most urgent waiting request."""
+        while self._waiters:
+            _, _, waiter = heapq.heappop(self._waiters)
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+
+        self._busy = False
@@ -7,7 +7,6 @@ from micloud.micloudexception import MiCloudAccessDenied
 import voluptuous as vol
 
 from homeassistant import config_entries
-from homeassistant.config_entries import SOURCE_REAUTH
 from homeassistant.core import callback
 from homeassistant.helpers.device_registry import format_mac
 from homeassistant.const import (
@@ -36,8 +35,24 @@ from homeassistant.components.xiaomi_miio.const import (
 from homeassistant.components.xiaomi_miio.device import ConnectXiaomiDevice
 
 from .const import (
+    CONF_DEADBAND,
+    CONF_DEADBAND_PERCENT,
+    CONF_MAX_SCAN_INTERVAL,
+    CONF_MIN_PUBLISH_INTERVAL,
+    CONF_MIN_SCAN_INTERVAL,
+    CONF_PUBLISH_HEARTBEAT,
+    CONF_STATUS_CACHE_AGE,
     DOMAIN,
+    DEFAULT_DEADBAND,
+    DEFAULT_DEADBAND_PERCENT,
+    DEFAULT_MAX_SCAN_INTERVAL,
+    DEFAULT_MIN_PUBLISH_INTERVAL,
+    DEFAULT_MIN_SCAN_INTERVAL,
+    DEFAULT_PUBLISH_HEARTBEAT,
     DEFAULT_SCAN_INTERVAL,
+    DEFAULT_STATUS_CACHE_AGE,
+    FILTERED_SENSORS,
+    MIN_SCAN_INTERVAL,
     MODELS_ALL_DEVICES
 )
 
@@ -79,36 +94,68 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
     async def async_step_init(self, user_input=None):
         """Manage the options."""
         errors = {}
+        options = self.config_entry.options
         if user_input is not None:
-            use_cloud = user_input.get(CONF_SCAN_INTERVAL, False)
-            cloud_username = self.config_entry.data.get(CONF_CLOUD_USERNAME)
-            cloud_password = self.config_entry.data.get(CONF_CLOUD_PASSWORD)
-            cloud_country = self.config_entry.data.get(CONF_CLOUD_COUNTRY)
-
-            if use_cloud and (
-                not cloud_username or not cloud_password or not cloud_country
+            min_interval = user_input.get(CONF_MIN_SCAN_INTERVAL, DEFAULT_MIN_SCAN_INTERVAL)
+            max_interval = user_input.get(CONF_MAX_SCAN_INTERVAL, DEFAULT_MAX_SCAN_INTERVAL)
+            scan_interval = user_input.get(CONF_SCAN_INTERVAL, DEFAULT_SCAN_INTERVAL)
+            if not min_interval <= scan_interval <= max_interval:
+                errors["base"] = "invalid_scan_interval"
+            heartbeat = user_input.get(CONF_PUBLISH_HEARTBEAT, DEFAULT_PUBLISH_HEARTBEAT)
+            if heartbeat and heartbeat < user_input.get(
+                CONF_MIN_PUBLISH_INTERVAL, DEFAULT_MIN_PUBLISH_INTERVAL
             ):
-                errors["base"] = "cloud_credentials_incomplete"
-                # trigger re-auth flow
-                self.hass.async_create_task(
-                    self.hass.config_entries.flow.async_init(
-                        DOMAIN,
-                        context={"source": SOURCE_REAUTH},
-                        data=self.config_entry.data,
-                    )
-                )
+                errors["base"] = "invalid_publish_interval"
 
             if not errors:
-                return self.async_create_entry(title="", data=user_input)
+                # the options hold the whole device configuration, keep it
+                return self.async_create_entry(
+                    title="", data={**options, **user_input}
+                )
 
         settings_schema = vol.Schema(
             {
                 vol.Optional(
                     CONF_SCAN_INTERVAL,
-                    default=self.config_entry.options.get(CONF_SCAN_INTERVAL, DEFAULT_SCAN_INTERVAL),
-                ): int
+                    default=options.get(CONF_SCAN_INTERVAL, DEFAULT_SCAN_INTERVAL),
+                ): vol.All(int, vol.Range(min=MIN_SCAN_INTERVAL)),
+                vol.Optional(
+                    CONF_MIN_SCAN_INTERVAL,
+                    default=options.get(CONF_MIN_SCAN_INTERVAL, DEFAULT_MIN_SCAN_INTERVAL),
+                ): vol.All(int, vol.Range(min=MIN_SCAN_INTERVAL)),
+                vol.Optional(
+                    CONF_MAX_SCAN_INTERVAL,
+                    default=options.get(CONF_MAX_SCAN_INTERVAL, DEFAULT_MAX_SCAN_INTERVAL),
+                ): vol.All(int, vol.Range(min=MIN_SCAN_INTERVAL)),
+                vol.Optional(
+                    CONF_STATUS_CACHE_AGE,
+                    default=options.get(CONF_STATUS_CACHE_AGE, DEFAULT_STATUS_CACHE_AGE),
+                ): vol.All(vol.Coerce(float), vol.Range(min=0)),
             }
         )
+        for key in FILTERED_SENSORS:
+            settings_schema = settings_schema.extend({
+                vol.Optional(
+                    CONF_DEADBAND.format(key),
+                    default=options.get(CONF_DEADBAND.format(key), DEFAULT_DEADBAND),
+                ): vol.All(vol.Coerce(float), vol.Range(min=0)),
+                vol.Optional(
+                    CONF_DEADBAND_PERCENT.format(key),
+                    default=options.get(
+                        CONF_DEADBAND_PERCENT.format(key), DEFAULT_DEADBAND_PERCENT
+                    ),
+                ): vol.All(vol.Coerce(float), vol.Range(min=0, max=100)),
+            })
+        settings_schema = settings_schema.extend({
+            vol.Optional(
+                CONF_MIN_PUBLISH_INTERVAL,
+                default=options.get(CONF_MIN_PUBLISH_INTERVAL, DEFAULT_MIN_PUBLISH_INTERVAL),
+            ): vol.All(int, vol.Range(min=0)),
+            vol.Optional(
+                CONF_PUBLISH_HEARTBEAT,
+                default=options.get(CONF_PUBLISH_HEARTBEAT, DEFAULT_PUBLISH_HEARTBEAT),
+            ): vol.All(int, vol.Range(min=0)),
+        })
 
         return self.async_show_form(
             step_id="init", data_schema=settings_schema, errors=errors
@@ -20,6 +20,7 @@ from homeassistant.components.button import (
 )
 
 from homeassistant.const import (
+    CONF_SCAN_INTERVAL,
     PERCENTAGE,
     UnitOfTemperature,
     UnitOfTime
@@ -31,9 +32,28 @@ DOMAINS = ["humidifier", "sensor", "switch", "button"]
 DATA_KEY = "xiaomi_humidifier_data"
 DATA_STATE = "state"
 DATA_DEVICE = "device"
+DATA_COORDINATOR = "coordinator"
+DATA_STORES = f"{DOMAIN}_stores"
+DATA_TRANSPORT = f"{DOMAIN}_transport"
+
+STORAGE_VERSION = 1
+STORAGE_SAVE_DELAY = 10
+STORE_CAPABILITIES = "capabilities"
+STORE_UNSUPPORTED = "unsupported"
+STORE_SESSIONS = "sessions"
+STORE_STATES = "states"
 
 CONF_MODEL = "model"
 CONF_MAC = "mac"
+CONF_MIN_SCAN_INTERVAL = "min_scan_interval"
+CONF_MAX_SCAN_INTERVAL = "max_scan_interval"
+CONF_DEVICE_INFO = "device_info"
+CONF_MIN_PUBLISH_INTERVAL = "min_publish_interval"
+CONF_PUBLISH_HEARTBEAT = "publish_heartbeat"
+CONF_STATUS_CACHE_AGE = "status_cache_age"
+# per sensor options, formatted with the key of the sensor
+CONF_DEADBAND = "{}_deadband"
+CONF_DEADBAND_PERCENT = "{}_deadband_percent"
 
 MODEL_DMAKER_DERH_22HT = "dmaker.derh.22ht"
 MODEL_DMAKER_DERH_22L = "dmaker.derh.22l"
@@ -56,9 +76,33 @@ MODELS_MIOT = [
 MODELS_ALL_DEVICES = MODELS_MIOT
 
 DEFAULT_SCAN_INTERVAL = 30
+DEFAULT_MIN_SCAN_INTERVAL = 5
+DEFAULT_MAX_SCAN_INTERVAL = 300
+MIN_SCAN_INTERVAL = 2
+# seconds, 0 turns the minimum publish interval or the heartbeat off
+DEFAULT_MIN_PUBLISH_INTERVAL = 0
+DEFAULT_PUBLISH_HEARTBEAT = 0
+DEFAULT_DEADBAND = 0
+DEFAULT_DEADBAND_PERCENT = 0
+# seconds a polled value is reused by the next polls, 0 polls every time
+DEFAULT_STATUS_CACHE_AGE = 0
 SCAN_INTERVAL = timedelta(seconds=DEFAULT_SCAN_INTERVAL)
 
+# measurement sensors whose publication can be filtered, changes within the
+# deadband or sooner than the minimum publish interval are not written
+FILTERED_SENSORS = ("temperature", "relative_humidity")
+
+# options which can be applied to a running entry without a reload
+LIVE_OPTIONS = (
+    CONF_SCAN_INTERVAL,
+    CONF_MIN_SCAN_INTERVAL,
+    CONF_MAX_SCAN_INTERVAL,
+    CONF_STATUS_CACHE_AGE,
+    CONF_DEVICE_INFO
+)
+
 ATTR_POWER = "power"
+ATTR_STALE = "stale"
 ATTR_TEMPERATURE = "temperature"
 ATTR_LOAD_POWER = "load_power"
 ATTR_MODEL = "model"
@@ -70,6 +114,26 @@ ATTR_WORKING_TIME = "working_time"
 ATTR_COUNT_DOWN_TIME = "count_down_time"
 ATTR_COUNT_DOWN = "count_down"
 ATTR_KEEP_RELAY = "keep_relay"
+ATTR_IS_ON = "is_on"
+ATTR_HUMIDITY = "humidity"
+ATTR_MODE = "mode"
+ATTR_INDICATOR_LIGHT = "indicator_light"
+ATTR_BUZZER = "buzzer"
+ATTR_CHILD_LOCK = "child_lock"
+ATTR_DRY_AFTER_OFF = "dry_after_off"
+
+SERVICE_APPLY_PROFILE = "apply_profile"
+
+# fields of the apply_profile service and the properties they set
+PROFILE_PROPERTIES = {
+    ATTR_IS_ON: "status",
+    ATTR_MODE: "mode",
+    ATTR_HUMIDITY: "target_humidity",
+    ATTR_INDICATOR_LIGHT: "indicator_light",
+    ATTR_BUZZER: "alarm",
+    ATTR_CHILD_LOCK: "physical_controls_locked",
+    ATTR_DRY_AFTER_OFF: "dry_after_off",
+}
 
 @dataclass
 class XiaomiHumidifierSensorDescription(
@@ -0,0 +1,356 @@
+"""Data update coordinator of the Xiaomi Smart Humidifier/Dehumidifier component."""
+# pylint: disable=import-error
+import asyncio
+import logging
+from datetime import timedelta
+from time import monotonic, time
+from typing import Any, Callable, Dict, FrozenSet, List, Mapping, Optional
+
+from homeassistant.const import CONF_SCAN_INTERVAL
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+from homeassistant.helpers import device_registry as dr
+from homeassistant.helpers.update_coordinator import (
+    DataUpdateCoordinator,
+    UpdateFailed
+)
+from miio import DeviceException, DeviceInfo
+
+from .humidifier_miot import MIOT_TABLES, HumidifierMiot, HumidifierStatusMiot
+from .miio_async import MAX_MESSAGE_ID
+from .scheduler import ACTIVITY_PROPERTIES, AdaptivePollScheduler
+from .storage import XiaomiHumidifierStore, async_get_store
+from .const import (
+    CONF_DEVICE_INFO,
+    CONF_MAX_SCAN_INTERVAL,
+    CONF_MIN_SCAN_INTERVAL,
+    CONF_STATUS_CACHE_AGE,
+    DEFAULT_MAX_SCAN_INTERVAL,
+    DEFAULT_MIN_SCAN_INTERVAL,
+    DEFAULT_SCAN_INTERVAL,
+    DEFAULT_STATUS_CACHE_AGE,
+    DOMAIN,
+    LIVE_OPTIONS,
+    STORE_CAPABILITIES,
+    STORE_SESSIONS,
+    STORE_STATES,
+    STORE_UNSUPPORTED
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+# properties polled even if no entity reads them, the adaptive poll interval
+# is picked from them and would go by stale values otherwise
+ALWAYS_POLLED = frozenset(ACTIVITY_PROPERTIES)
+# message ids stored ahead of the last used one, the session is saved again
+# once they are used up so ids sent before a restart are never reused
+MESSAGE_ID_RESERVE = 500
+# seconds between refreshes of the device info, to notice firmware updates
+INFO_REFRESH_INTERVAL = 24 * 60 * 60
+# seconds after which the properties a device rejects are probed again
+PROBE_INTERVAL = 7 * 24 * 60 * 60
+# miIO.info fields kept in the config entry
+DEVICE_INFO_FIELDS = ("model", "fw_ver", "hw_ver", "mac")
+# seconds the device gets to apply a write before it is read back
+VERIFY_DELAY = 2
+
+
+class XiaomiHumidifierDataUpdateCoordinator(DataUpdateCoordinator[HumidifierStatusMiot]):
+    """Fetch the status of one Smart Humidifier/Dehumidifier for all its entities."""
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        humidifier: HumidifierMiot,
+        host: str,
+        options: Mapping[str, Any]
+    ) -> None:
+        """Initialize the coordinator."""
+        scheduler = AdaptivePollScheduler(*_scan_intervals(options))
+        super().__init__(
+            hass,
+            _LOGGER,
+            name=f"{DOMAIN} {host}",
+            update_interval=timedelta(seconds=scheduler.interval),
+        )
+        self.humidifier = humidifier
+        self.humidifier.cache_age = options.get(CONF_STATUS_CACHE_AGE, DEFAULT_STATUS_CACHE_AGE)
+        self.host = host
+        self._options = dict(options)
+        self._scheduler = scheduler
+        # the info of the last run until it is fetched again
+        cached_info = options.get(CONF_DEVICE_INFO)
+        self.info: Optional[DeviceInfo] = DeviceInfo(cached_info) if cached_info else None
+        self._info_fetched_at: Optional[float] = None
+        self._info_task: Optional[asyncio.Task] = None
+        # written values waiting to be read back
+        self._unverified: Dict[str, Any] = {}
+        self._verify_task: Optional[asyncio.Task] = None
+        self._capabilities: Optional[XiaomiHumidifierStore] = None
+        self._unsupported: Optional[XiaomiHumidifierStore] = None
+        self._sessions: Optional[XiaomiHumidifierStore] = None
+        self._states: Optional[XiaomiHumidifierStore] = None
+        self._probe_needed = False
+        # mappings the probe tries, None for all known ones
+        self._probe_layouts: Optional[List[str]] = None
+        # wall clock time of the last probe, the rejected properties expire
+        self._probed_at: Optional[float] = None
+        # the data was restored from the last run and not polled yet
+        self.stale = False
+        # set once the entities of all platforms are added, polls made before
+        # cannot tell which properties the entities read
+        self.platforms_ready = False
+
+    async def async_restore(self) -> None:
+        """Apply what was stored for the device by earlier runs.
+
+        The mapping probed for the model and the properties the device
+        rejected skip the probe until they expire, the stored session of the
+        device skips the handshake, and the last known status is shown as
+        stale until the first poll.
+        """
+        self._capabilities = await async_get_store(self.hass, STORE_CAPABILITIES)
+        self._unsupported = await async_get_store(self.hass, STORE_UNSUPPORTED)
+        cached = self._capabilities.get(self.humidifier.model)
+        rejected = self._unsupported.get(self.host)
+        if cached is not None and cached.get("layout") in MIOT_TABLES:
+            # the other devices of the model found the mapping
+            self._probe_layouts = [cached["layout"]]
+            if rejected is not None and time() - rejected["probed_at"] < PROBE_INTERVAL:
+                self.humidifier.set_capabilities(cached["layout"], rejected["unsupported"])
+                self._probed_at = rejected["probed_at"]
+        if self._probed_at is None:
+            self._probe_needed = True
+
+        self._sessions = await async_get_store(self.hass, STORE_SESSIONS)
+        session = self._sessions.get(self.host)
+        if session is not None:
+            self.humidifier.restore_session(session)
+
+        self._states = await async_get_store(self.hass, STORE_STATES)
+        values = self._states.get(self.host)
+        if values is not None:
+            self.data = self.humidifier.restore_status(values)
+            self.stale = True
+
+    @callback
+    def async_apply_options(self, options: Mapping[str, Any]) -> bool:
+        """Apply changed options in place, return False if a reload is needed."""
+        if _static_options(options) != _static_options(self._options):
+            return False
+
+        intervals_changed = _scan_intervals(options) != _scan_intervals(self._options)
+        self._options = dict(options)
+        self.humidifier.cache_age = options.get(CONF_STATUS_CACHE_AGE, DEFAULT_STATUS_CACHE_AGE)
+        if intervals_changed:
+            self._scheduler.set_bounds(*_scan_intervals(options))
+            # reschedule the pending poll with the new interval
+            self._async_reschedule(self._scheduler.interval)
+        return True
+
+    async def async_shutdown(self) -> None:
+        """Stop polling, fetching the device info and reading back writes."""
+        await super().async_shutdown()
+        if self._info_task is not None:
+            self._info_task.cancel()
+        if self._verify_task is not None:
+            self._verify_task.cancel()
+
+    @callback
+    def async_note_command(self) -> None:
+        """Poll quickly for a while after a command was sent to the device."""
+        self._async_reschedule(self._scheduler.note_command())
+
+    @callback
+    def async_apply_write(self, values: Mapping[str, Any]) -> None:
+        """Show the values written to the device and read them back shortly after.
+
+        The entities show the written values right away. If the device does
+        not report them when they are read back, its values replace them.
+        """
+        self._async_publish(self.humidifier.apply_values(values))
+        self._unverified.update(values)
+        if self._verify_task is None:
+            self._verify_task = self.hass.async_create_background_task(
+                self._async_verify_writes(), f"{self.name} verify writes"
+            )
+
+    async def _async_verify_writes(self) -> None:
+        """Read back the written properties only and publish what the device reports."""
+        await asyncio.sleep(VERIFY_DELAY)
+        self._verify_task = None
+        written, self._unverified = self._unverified, {}
+        try:
+            state = await self.humidifier.async_status(written.keys())
+        except DeviceException as ex:
+            # the next poll reads them again
+            _LOGGER.debug("Unable to read back %s from %s: %s", list(written), self.host, ex)
+            return
+
+        rejected = {
+            name: state.data.get(name)
+            for name, value in written.items()
+            if state.data.get(name) != value
+        }
+        if rejected:
+            _LOGGER.debug("%s did not apply %s, it reports %s", self.host, written, rejected)
+        self._async_publish(state)
+
+    @callback
+    def _async_publish(self, state: HumidifierStatusMiot) -> None:
+        """Hand a status to the entities, the next poll stays scheduled as it is."""
+        self.data = state
+        self.async_update_listeners()
+
+    @callback
+    def async_add_listener(
+        self, update_callback: CALLBACK_TYPE, context: Any = None
+    ) -> Callable[[], None]:
+        """Listen for data updates, context holds the properties the listener reads."""
+        remove_listener = super().async_add_listener(update_callback, context)
+        # an entity was enabled which reads properties not polled so far
+        if context and self.data is not None and not context <= self.data.data.keys():
+            self.hass.async_create_task(self.async_request_refresh())
+
+        return remove_listener
+
+    def wanted_properties(self) -> Optional[FrozenSet[str]]:
+        """Return the properties read by the enabled entities, None for all."""
+        contexts = list(self.async_contexts())
+        # poll everything until the entities of all platforms are set up
+        if not self.platforms_ready or not contexts:
+            return None
+
+        return ALWAYS_POLLED.union(*contexts)
+
+    @callback
+    def _async_reschedule(self, interval: float) -> None:
+        """Schedule the next poll after the given number of seconds."""
+        self.update_interval = timedelta(seconds=interval)
+        self._schedule_refresh()
+
+    @callback
+    def _async_save_capabilities(self) -> None:
+        """Store the mapping of the model and the properties the device rejects."""
+        if self._capabilities is None or self._unsupported is None:
+            return
+
+        capabilities = {"layout": self.humidifier.layout}
+        if self._capabilities.get(self.humidifier.model) != capabilities:
+            self._capabilities.async_set(self.humidifier.model, capabilities)
+
+        rejected = {
+            "unsupported": sorted(self.humidifier.unsupported),
+            "probed_at": self._probed_at,
+        }
+        if self._unsupported.get(self.host) != rejected:
+            self._unsupported.async_set(self.host, rejected)
+
+    @callback
+    def _async_save_session(self) -> None:
+        """Store the session of the device with message ids reserved ahead."""
+        session = self.humidifier.session()
+        if self._sessions is None or session is None:
+            return
+
+        stored = self._sessions.get(self.host)
+        if (
+            stored is not None
+            and stored["device_id"] == session["device_id"]
+            and 0 < (stored["id"] - session["id"]) % MAX_MESSAGE_ID <= MESSAGE_ID_RESERVE
+        ):
+            return
+
+        session["id"] = (session["id"] + MESSAGE_ID_RESERVE) % MAX_MESSAGE_ID
+        self._sessions.async_set(self.host, session)
+
+    @callback
+    def _async_schedule_info_refresh(self) -> None:
+        """Fetch the device info in the background once a day."""
+        if self._info_task is not None or (
+            self._info_fetched_at is not None
+            and monotonic() - self._info_fetched_at < INFO_REFRESH_INTERVAL
+        ):
+            return
+
+        self._info_task = self.hass.async_create_background_task(
+            self._async_refresh_info(), f"{self.name} device info"
+        )
+
+    async def _async_refresh_info(self) -> None:
+        """Fetch the device info, store it and update the device registry if it changed."""
+        try:
+            info = await self.humidifier.async_info()
+        except DeviceException as ex:
+            _LOGGER.debug("Unable to fetch the info of %s: %s", self.host, ex)
+            return
+        finally:
+            self._info_task = None
+
+        self._info_fetched_at = monotonic()
+        cached_info = {key: info.raw.get(key) for key in DEVICE_INFO_FIELDS}
+        if self.info is not None and self.info.raw == cached_info:
+            return
+
+        _LOGGER.debug("Got new info of %s: %s", self.host, cached_info)
+        self.info = DeviceInfo(cached_info)
+        if self.config_entry is None:
+            return
+
+        # kept in the options, so the next start does not need the network
+        self.hass.config_entries.async_update_entry(
+            self.config_entry,
+            options={**self.config_entry.options, CONF_DEVICE_INFO: cached_info}
+        )
+        registry = dr.async_get(self.hass)
+        for device in dr.async_entries_for_config_entry(registry, self.config_entry.entry_id):
+            registry.async_update_device(
+                device.id,
+                sw_version=info.firmware_version,
+                hw_version=info.hardware_version
+            )
+
+    async def _async_update_data(self) -> HumidifierStatusMiot:
+        """Fetch the status of the device in one batched request."""
+        try:
+            if self._probe_needed or time() - self._probed_at >= PROBE_INTERVAL:
+                layout, unsupported = await self.humidifier.async_probe(self._probe_layouts)
+                _LOGGER.debug(
+                    "Probed %s: mapping of %s, unsupported %s", self.host, layout, unsupported
+                )
+                self._probe_needed = False
+                self._probe_layouts = [layout]
+                self._probed_at = time()
+                # the probe read every property, it is the poll
+                state = self.humidifier.known_status()
+            else:
+                state = await self.humidifier.async_status(self.wanted_properties())
+        except DeviceException as ex:
+            self.update_interval = timedelta(seconds=self._scheduler.note_failure())
+            raise UpdateFailed(f"Got exception while fetching the state: {ex}") from ex
+
+        _LOGGER.debug("Got new state: %s", state)
+        # the device answered, so the info is fetched without waiting for a timeout
+        self._async_schedule_info_refresh()
+        # properties probed as unsupported or pruned after repeated failures
+        self._async_save_capabilities()
+        self._async_save_session()
+        if self._states is not None and self._states.get(self.host) != state.data:
+            self._states.async_set(self.host, dict(state.data))
+        self.stale = False
+        # the next poll is scheduled with this interval once the update is done
+        self.update_interval = timedelta(seconds=self._scheduler.next_interval(state.data))
+        return state
+
+
+def _scan_intervals(options: Mapping[str, Any]) -> tuple:
+    """Return the configured scan, minimum and maximum interval of an entry."""
+    return (
+        options.get(CONF_SCAN_INTERVAL, DEFAULT_SCAN_INTERVAL),
+        options.get(CONF_MIN_SCAN_INTERVAL, DEFAULT_MIN_SCAN_INTERVAL),
+        options.get(CONF_MAX_SCAN_INTERVAL, DEFAULT_MAX_SCAN_INTERVAL),
+    )
+
+
+def _static_options(options: Mapping[str, Any]) -> dict:
+    """Return the options which need a reload when changed."""
+    return {key: value for key, value in options.items() if key not in LIVE_OPTIONS}
@@ -1,8 +1,6 @@
 """Humidifier of the Xiaomi Smart Humidifier/Dehumidifier component."""
 # pylint: disable=import-error
 import logging
-from datetime import timedelta
-from functools import partial
 
 from miio import DeviceException
 import voluptuous as vol
@@ -13,36 +11,48 @@ from homeassistant.components.humidifier import (
 )
 from homeassistant.components.humidifier.const import HumidifierEntityFeature
 from homeassistant.config_entries import SOURCE_IMPORT
+from homeassistant.core import ServiceResponse, SupportsResponse, callback
+from homeassistant.exceptions import HomeAssistantError
 from homeassistant.const import (
     CONF_DEVICE,
     CONF_HOST,
-    CONF_TOKEN,
-    CONF_MAC
+    CONF_TOKEN
 )
 import homeassistant.helpers.config_validation as cv
 from homeassistant.helpers import device_registry as dr
+from homeassistant.helpers import entity_platform
+from homeassistant.helpers.update_coordinator import CoordinatorEntity
 from homeassistant.util import slugify
 from homeassistant.components.xiaomi_miio.const import (
     CONF_FLOW_TYPE
 )
-from .humidifier_miot import PowerMode_V1
+from .humidifier_miot import PowerMode_V1, properties_for
 
 from .const import (
+    ATTR_BUZZER,
+    ATTR_CHILD_LOCK,
+    ATTR_DRY_AFTER_OFF,
+    ATTR_HUMIDITY,
+    ATTR_INDICATOR_LIGHT,
+    ATTR_IS_ON,
+    ATTR_MODE,
+    ATTR_STALE,
     ATTR_TEMPERATURE,
     ATTR_MODEL,
     ATTR_POWER_MODE,
     ATTR_WIFI_LED,
     CONF_MODEL,
-    DATA_KEY,
+    DATA_COORDINATOR,
+    DATA_DEVICE,
     DOMAIN,
     MODELS_MIOT,
-    MODELS_ALL_DEVICES
+    MODELS_ALL_DEVICES,
+    PROFILE_PROPERTIES,
+    SERVICE_APPLY_PROFILE
 )
 
 _LOGGER = logging.getLogger(__name__)
 
-SCAN_INTERVAL = timedelta(seconds=60)
-
 PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend(
     {
         vol.Required(CONF_HOST): cv.string,
@@ -69,6 +79,21 @@ FEATURE_FLAGS_GENERIC = 0
 TARGET_HUMIDITY_MAX_V1 = 70
 TARGET_HUMIDITY_MIN_V1 = 40
 
+SERVICE_SCHEMA_APPLY_PROFILE = vol.All(
+    cv.make_entity_service_schema({
+        vol.Optional(ATTR_IS_ON): cv.boolean,
+        vol.Optional(ATTR_MODE): vol.In([mode.name for mode in PowerMode_V1]),
+        vol.Optional(ATTR_HUMIDITY): vol.All(
+            vol.Coerce(int), vol.Range(min=TARGET_HUMIDITY_MIN_V1, max=TARGET_HUMIDITY_MAX_V1)
+        ),
+        vol.Optional(ATTR_INDICATOR_LIGHT): cv.boolean,
+        vol.Optional(ATTR_BUZZER): cv.boolean,
+        vol.Optional(ATTR_CHILD_LOCK): cv.boolean,
+        vol.Optional(ATTR_DRY_AFTER_OFF): cv.boolean,
+    }),
+    cv.has_at_least_one_key(*PROFILE_PROPERTIES),
+)
+
 async def async_setup_platform(hass, config, async_add_entities, discovery_info=None):
     """Import Xiaomi Smart Humidifier/Dehumidifier configuration from YAML."""
     _LOGGER.warning(
@@ -94,14 +119,12 @@ async def async_setup_entry(hass, config_entry, async_add_entities):
     unique_id = config_entry.unique_id
 
     if config_entry.options[CONF_FLOW_TYPE] == CONF_DEVICE:
-        if DATA_KEY not in hass.data:
-            hass.data[DATA_KEY] = {}
-
-        humidifier = hass.data[DOMAIN][host]
+        humidifier = hass.data[DOMAIN][host][DATA_DEVICE]
+        coordinator = hass.data[DOMAIN][host][DATA_COORDINATOR]
         if model in MODELS_MIOT:
-            device = XiaomiHumidifierMiot(name, humidifier, model, unique_id, config_entry.options)
+            device = XiaomiHumidifierMiot(
+                coordinator, name, humidifier, model, unique_id, config_entry.options)
             entities.append(device)
-            hass.data[DATA_KEY][host] = device
         else:
             _LOGGER.error(
                 "Unsupported device found! Please create an issue at "
@@ -114,17 +137,28 @@ async def async_setup_entry(hass, config_entry, async_add_entities):
 
     async_add_entities(entities, update_before_add=False)
 
+    platform = entity_platform.async_get_current_platform()
+    platform.async_register_entity_service(
+        SERVICE_APPLY_PROFILE,
+        SERVICE_SCHEMA_APPLY_PROFILE,
+        "async_apply_profile",
+        supports_response=SupportsResponse.OPTIONAL,
+    )
+
 
-class XiaomiGenericHumidifier(HumidifierEntity):
+class XiaomiGenericHumidifier(CoordinatorEntity, HumidifierEntity):
     """Representation of a Xiaomi Humidifier Generic Entity."""
 
-    def __init__(self, name, humidifier, model, unique_id):
+    def __init__(self, coordinator, name, humidifier, model, unique_id):
         """Initialize the humidifier."""
+        super().__init__(
+            coordinator,
+            context=properties_for(("is_on", "temperature", "mode", "target_humidity"))
+        )
         self._name = name
         self._humidifier = humidifier
         self._model = model
         self._unique_id = unique_id
-        self._mac = None
 
         self._icon = "mdi:air-humidifier"
         self._available = False
@@ -132,8 +166,8 @@ class XiaomiGenericHumidifier(HumidifierEntity):
         self._status = None
         self._state_attrs = {ATTR_TEMPERATURE: None, ATTR_MODEL: self._model}
         self._device_features = FEATURE_FLAGS_GENERIC
-        self._skip_update = False
         self._attr_mode = None
+        self._written_state = None
 
     @property
     def unique_id(self):
@@ -168,18 +202,18 @@ class XiaomiGenericHumidifier(HumidifierEntity):
     @property
     def device_info(self):
         """Return the device info."""
-        info = self._humidifier.info()
+        info = self.coordinator.info
         device_info = {
             "identifiers": {(DOMAIN, self._unique_id)},
             "manufacturer": (self._model or "Xiaomi").split(".", 1)[0].capitalize(),
             "name": self._name,
-            "model": self._model,
-            "sw_version": info.firmware_version,
-            "hw_version": info.hardware_version
+            "model": self._model
         }
-
-        if self._mac is not None:
-            device_info["connections"] = {(dr.CONNECTION_NETWORK_MAC, self._mac)}
+        if info is not None:
+            device_info["sw_version"] = info.firmware_version
+            device_info["hw_version"] = info.hardware_version
+            if info.mac_address:
+                device_info["connections"] = {(dr.CONNECTION_NETWORK_MAC, info.mac_address)}
 
         return device_info
 
@@ -191,13 +225,18 @@ class XiaomiGenericHumidifier(HumidifierEntity):
     async def _try_command(self, mask_error, func, *args, **kwargs):
         """Call a humidifier command handling error messages."""
         try:
-            result = await self.hass.async_add_executor_job(
-                partial(func, *args, **kwargs)
-            )
+            result = await func(*args, **kwargs)
 
             _LOGGER.debug("Response received from humidifier: %s", result)
 
-            return result == SUCCESS
+            if isinstance(result, list):
+                success = all(item.get("code", -1) == 0 for item in result)
+            else:
+                success = result == SUCCESS
+            if success:
+                self.coordinator.async_note_command()
+
+            return success
         except DeviceException as exc:
             if self._available:
                 _LOGGER.error(mask_error, exc)
@@ -205,50 +244,83 @@ class XiaomiGenericHumidifier(HumidifierEntity):
 
             return False
 
-    async def async_turn_on(self, **kwargs):
-        """Turn the humidifier on."""
-        result = await self._try_command("Turning the humidifier on failed.", self._humidifier.on)
+    async def _async_set_property(self, mask_error, name, value):
+        """Set a property, show it right away and have the coordinator read it back."""
+        result = await self._try_command(
+            mask_error, self._humidifier.async_set_property, name, value
+        )
 
         if result:
-            self._state = True
-            self._skip_update = True
+            self.coordinator.async_apply_write({name: value})
+
+        return result
+
+    async def async_turn_on(self, **kwargs):
+        """Turn the humidifier on."""
+        await self._async_set_property("Turning the humidifier on failed.", "status", True)
 
     async def async_turn_off(self, **kwargs):
         """Turn the humidifier off."""
-        result = await self._try_command("Turning the humidifier off failed.", self._humidifier.off)
-
-        if result:
-            self._state = False
-            self._skip_update = True
-
-    async def async_update(self):
-        """Fetch state from the device."""
-        # On state change the device doesn't provide the new state immediately.
-        if self._skip_update:
-            self._skip_update = False
-            return
+        await self._async_set_property("Turning the humidifier off failed.", "status", False)
+
+    async def async_added_to_hass(self) -> None:
+        """Handle entity which will be added."""
+        await super().async_added_to_hass()
+        self._handle_coordinator_update()
+
+    def _state_signature(self) -> tuple:
+        """Return everything the state written to Home Assistant depends on."""
+        return (
+            self._available,
+            self._state,
+            self._attr_mode,
+            self._attr_target_humidity,
+            tuple(self._state_attrs.items()),
+        )
 
-        try:
-            state = await self.hass.async_add_executor_job(self._humidifier.status)
-            _LOGGER.debug("Got new state: %s", state)
+    @callback
+    def async_write_ha_state(self) -> None:
+        """Write the state and remember it, so an unchanged one is not written again."""
+        self._written_state = self._state_signature()
+        super().async_write_ha_state()
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        """Handle updated data from the coordinator."""
+        state = self.coordinator.data
+        # properties of a newly enabled entity are missing until the next poll
+        self._available = (
+            self.coordinator.last_update_success
+            and state is not None
+            and self.coordinator_context <= state.data.keys()
+        )
+        if self._available:
             self._status = state
-
-            self._available = True
-            self._state = state.is_on
-            self._state_attrs[ATTR_TEMPERATURE] = state.temperature
-
-        except DeviceException as ex:
-            if self._available:
-                self._available = False
-                _LOGGER.error("Got exception while fetching the state: %s", ex)
+            self._update_from_status(state)
+            # restored from the last run until the first poll
+            if self.coordinator.stale:
+                self._state_attrs[ATTR_STALE] = True
+            else:
+                self._state_attrs.pop(ATTR_STALE, None)
+
+        # polls which change nothing shown by the entity are not written
+        if self._state_signature() != self._written_state:
+            self.async_write_ha_state()
+
+    def _update_from_status(self, state):
+        """Update the entity from the device status."""
+        self._state = state.is_on
+        self._state_attrs[ATTR_TEMPERATURE] = state.temperature
 
     async def async_set_wifi_led_on(self):
         """Turn the wifi led on."""
         if self._device_features & FEATURE_SET_WIFI_LED == 0:
             return
 
-        await self._try_command(
-            "Turning the wifi led on failed.", self._humidifier.set_wifi_led, True
+        await self._async_set_property(
+            "Turning the wifi led on failed.",
+            "indicator_light",
+            True
         )
 
     async def async_set_wifi_led_off(self):
@@ -256,16 +328,18 @@ class XiaomiGenericHumidifier(HumidifierEntity):
         if self._device_features & FEATURE_SET_WIFI_LED == 0:
             return
 
-        await self._try_command(
-            "Turning the wifi led off failed.", self._humidifier.set_wifi_led, False
+        await self._async_set_property(
+            "Turning the wifi led off failed.",
+            "indicator_light",
+            False
         )
 
     async def async_set_humidity(self, humidity: int) -> None:
         """Set new target humidity."""
 
-        await self._try_command(
+        await self._async_set_property(
             "Setting the power mode of the humidifier failed.",
-            self._humidifier.set_humidity,
+            "target_humidity",
             humidity,
         )
 
@@ -273,10 +347,9 @@ class XiaomiGenericHumidifier(HumidifierEntity):
 class XiaomiHumidifierMiot(XiaomiGenericHumidifier):
     """Representation of a Xiaomi Smart Humidifier/Dehumidifier Miot"""
 
-    def __init__(self, name, humidifier, model, unique_id, config):
+    def __init__(self, coordinator, name, humidifier, model, unique_id, config):
         """Initialize the humidifier."""
-        super().__init__(name, humidifier, model, unique_id)
-        self._mac = config.get(CONF_MAC, config.get(CONF_TOKEN))
+        super().__init__(coordinator, name, humidifier, model, unique_id)
         self._host = config[CONF_HOST]
         self._status = None
 
@@ -295,46 +368,56 @@ class XiaomiHumidifierMiot(XiaomiGenericHumidifier):
         if self._device_features & FEATURE_SET_WIFI_LED == 1:
             self._state_attrs[ATTR_WIFI_LED] = None
 
-    async def async_update(self):
-        """Fetch state from the device."""
-        # On state change the device doesn't provide the new state immediately.
-        if self._skip_update:
-            self._skip_update = False
-            return
-
-        try:
-            state = await self.hass.async_add_executor_job(self._humidifier.status)
-            self._status = state
-            _LOGGER.debug("Got new state: %s", state)
+    def _update_from_status(self, state):
+        """Update the entity from the device status."""
+        self._state = state.is_on
+        self._state_attrs.update(
+            {ATTR_TEMPERATURE: state.temperature}
+        )
 
-            self._available = True
-            self._state = state.is_on
-            self._state_attrs.update(
-                {ATTR_TEMPERATURE: state.temperature}
-            )
+        if self._device_features & FEATURE_SET_POWER_MODE == 1 and state.mode:
+            self._state_attrs[ATTR_POWER_MODE] = state.mode
+            self._attr_mode = state.mode
 
-            if self._device_features & FEATURE_SET_POWER_MODE == 1 and state.mode:
-                self._state_attrs[ATTR_POWER_MODE] = state.mode
-                self._attr_mode = state.mode
+        if self._device_features & FEATURE_SET_WIFI_LED == 1 and state.wifi_led:
+            self._state_attrs[ATTR_WIFI_LED] = state.wifi_led
 
-            if self._device_features & FEATURE_SET_WIFI_LED == 1 and state.wifi_led:
-                self._state_attrs[ATTR_WIFI_LED] = state.wifi_led
+        self._attr_target_humidity = state.target_humidity
 
-            self._attr_target_humidity = state.target_humidity
+    async def async_apply_profile(self, **profile) -> ServiceResponse:
+        """Set all settings of a profile in one request, return the result code of each."""
+        values = {PROFILE_PROPERTIES[field]: value for field, value in profile.items()}
+        if "mode" in values:
+            values["mode"] = PowerMode_V1[values["mode"]].value
 
+        try:
+            results = await self._humidifier.async_write_properties(values)
         except DeviceException as ex:
-            if self._available:
-                self._available = False
-                _LOGGER.error("Got exception while fetching the state: %s", ex)
+            raise HomeAssistantError(f"Applying the profile to {self._name} failed: {ex}") from ex
+
+        codes = {
+            field: results.get(PROFILE_PROPERTIES[field], {}).get("code", -1)
+            for field in profile
+        }
+        applied = {
+            PROFILE_PROPERTIES[field]: values[PROFILE_PROPERTIES[field]]
+            for field, code in codes.items()
+            if code == 0
+        }
+        if applied:
+            self.coordinator.async_note_command()
+            self.coordinator.async_apply_write(applied)
+
+        return codes
 
     async def async_set_mode(self, mode: str) -> None:
         """Set new mode."""
         if self._device_features & FEATURE_SET_POWER_MODE == 0:
             return
 
-        await self._try_command(
+        await self._async_set_property(
             "Setting the power mode of the humidifier failed.",
-            self._humidifier.set_power_mode,
+            "mode",
             PowerMode_V1[mode].value,
         )
 
@@ -343,8 +426,8 @@ class XiaomiHumidifierMiot(XiaomiGenericHumidifier):
         if self._device_features & FEATURE_SET_BUZZER == 0:
             return
 
-        await self._try_command(
+        await self._async_set_property(
             "Setting the buzzer of the humidifier failed.",
-            self._humidifier.set_buzzer,
+            "alarm",
             mode,
         )
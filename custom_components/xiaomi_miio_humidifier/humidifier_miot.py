@@ -2,14 +2,23 @@
 Support for Xiaomi Smart Humidifier/Dehumidifier
 
 """
+import asyncio
 import enum
-from typing import Any, Dict
+from time import monotonic
+from types import MappingProxyType
+from typing import (
+    Any, Dict, FrozenSet, Iterable, List, Mapping, NamedTuple, Optional, Set, Tuple
+)
 import logging
 import click
 
+from miio import DeviceException
 from miio.click_common import command, format_output
-from miio.device import DeviceStatus
+from miio.deviceinfo import DeviceInfo
 from miio.miot_device import MiotDevice
+from .coalescer import WriteCoalescer
+from .command_queue import PRIORITY_BACKGROUND, PRIORITY_COMMAND, PRIORITY_POLL, CommandQueue
+from .miio_async import AsyncMiioProtocol, MiioTransport
 from .const import (
     MODEL_DMAKER_DERH_22HT,
     MODEL_DMAKER_DERH_22L,
@@ -79,8 +88,118 @@ MIOT_MAPPING = {
 }
 
 
-class DeviceException(Exception):
-    """Exception wrapping any communication errors with the device."""
+# refresh tiers of the properties, a property is polled again once its value
+# is older than the maximum age of its tier, on-write properties are only
+# polled again after they were written
+TIER_FAST = "fast"
+TIER_NORMAL = "normal"
+TIER_SLOW = "slow"
+TIER_ON_WRITE = "on_write"
+
+TIER_MAX_AGE = {
+    TIER_FAST: 0,
+    TIER_NORMAL: 120,
+    TIER_SLOW: 900,
+    TIER_ON_WRITE: None,
+}
+
+MIOT_PROPERTY_TIERS = {
+    "status": TIER_FAST,
+    "device_fault": TIER_NORMAL,
+    "mode": TIER_FAST,
+    "target_humidity": TIER_NORMAL,
+    "relative_humidity": TIER_FAST,
+    "temperature": TIER_FAST,
+    "alarm": TIER_SLOW,
+    "indicator_light": TIER_SLOW,
+    "light_mode": TIER_ON_WRITE,
+    "physical_controls_locked": TIER_SLOW,
+    "off_delay_time": TIER_ON_WRITE,
+    "dry_after_off": TIER_SLOW,
+    "dry_left_time": TIER_FAST,
+    "is_warming_up": TIER_FAST,
+}
+
+MIOT_WRITABLE_PROPERTIES = frozenset((
+    "status",
+    "mode",
+    "target_humidity",
+    "alarm",
+    "indicator_light",
+    "light_mode",
+    "physical_controls_locked",
+    "off_delay_time",
+    "dry_after_off",
+))
+
+# properties per get_properties request, some firmwares reject more
+MAX_PROPERTIES = 15
+# failed reads in a row after which a property is no longer polled
+MAX_PROPERTY_FAILURES = 3
+
+# status attributes which are not named after the property they read
+STATUS_ATTRIBUTE_PROPERTIES = {
+    "is_on": ("status",),
+    "system_status": ("device_fault",),
+}
+
+
+class MiotTables(NamedTuple):
+    """Property and action tables of one model, compiled from its mapping."""
+    # name -> get_properties request entry
+    read: Dict[str, Dict[str, Any]]
+    # name -> set_properties request entry, without the value
+    write: Dict[str, Dict[str, Any]]
+    # name -> action request, without the input parameters
+    actions: Dict[str, Dict[str, Any]]
+    # (siid, piid) -> name
+    reverse: Dict[Tuple[int, int], str]
+    # name -> maximum age of the refresh tier
+    max_age: Dict[str, Optional[float]]
+    # request entries of all readable properties
+    payload: Tuple[Dict[str, Any], ...]
+
+
+def compile_mapping(mapping: Dict[str, Dict[str, int]]) -> MiotTables:
+    """Split a MIoT mapping into read, write and action tables."""
+    read = {}
+    write = {}
+    actions = {}
+    for name, prop in mapping.items():
+        if "aiid" in prop:
+            actions[name] = {
+                "did": f"call-{prop['siid']}-{prop['aiid']}",
+                "siid": prop["siid"],
+                "aiid": prop["aiid"],
+            }
+            continue
+
+        read[name] = {"did": name, "siid": prop["siid"], "piid": prop["piid"]}
+        if name in MIOT_WRITABLE_PROPERTIES:
+            write[name] = read[name]
+
+    return MiotTables(
+        read=read,
+        write=write,
+        actions=actions,
+        reverse={(prop["siid"], prop["piid"]): name for name, prop in read.items()},
+        max_age={
+            name: TIER_MAX_AGE[MIOT_PROPERTY_TIERS.get(name, TIER_FAST)] for name in read
+        },
+        payload=tuple(read.values()),
+    )
+
+
+MIOT_TABLES = {model: compile_mapping(mapping) for model, mapping in MIOT_MAPPING.items()}
+
+
+def properties_for(attributes: Iterable[str]) -> FrozenSet[str]:
+    """Return the properties read by the given status attributes."""
+    properties = set()
+    for attribute in attributes:
+        properties.update(STATUS_ATTRIBUTE_PROPERTIES.get(attribute, (attribute,)))
+
+    return frozenset(properties)
 
 
 class Status(enum.Enum):
@@ -113,105 +232,93 @@ class PowerMode_V1(enum.Enum):
     Clothes_Drying = 2
 
 
-class HumidifierStatusMiot(DeviceStatus):
-    """Container for status reports for Xiaomi Smart Humidifier/Dehumidifie."""
-
-    def __init__(self, data: Dict[str, Any]) -> None:
-        """
-        {
-            'id': 1,
-            'result': [
-                {'did': 'status', 'siid': 2, 'piid': 1, 'code': 0, 'value': 0},
-                {'did': 'mode', 'siid': 2, 'piid': 2, 'code': 0, 'value': 0},
-                {'did': 'temperature', 'siid': 3, 'piid': 2, 'code': 0, 'value': 0}
-            ],
-            'exe_time': 280
-        }
-        """
-        self.data = data
-
-    @property
-    def is_on(self) -> bool:
-        """True if device is currently on."""
-        return self.data["status"]
-
-    @property
-    def mode(self) -> str:
-        """Mode."""
-        return PowerMode_V1(self.data.get("mode")).name
-
-    @property
-    def status(self) -> int:
-        """Operation status."""
-        try:
-            return Status(self.data["status"])
-        except ValueError:
-            _LOGGER.error("Unknown Status (%s)", self.data["status"])
-            return Status.Unknown
-
-    @property
-    def temperature(self) -> int:
-        """Temperature"""
-        return self.data["temperature"]
-
-    @property
-    def relative_humidity(self) -> int:
-        """Relative Humidity"""
-        return self.data["relative_humidity"]
-
-    @property
-    def target_humidity(self) -> int:
-        """Target Humidity"""
-        return self.data["target_humidity"]
-
-    @property
-    def indicator_light(self) -> int:
-        """LED"""
-        return self.data["indicator_light"]
-
-    @property
-    def alarm(self) -> int:
-        """Buzzer"""
-        return self.data["alarm"]
-
-    @property
-    def dry_after_off(self) -> int:
-        """Dry after off"""
-        return self.data["dry_after_off"]
-
-    @property
-    def light_mode(self) -> int:
-        """LED"""
-        return self.data["light_mode"]
-
-    @property
-    def physical_controls_locked(self) -> int:
-        """Children lock"""
-        return self.data["physical_controls_locked"]
-
-    @property
-    def system_status(self) -> int:
-        """System status."""
-        try:
-            return SystemStatus(self.data["device_fault"])
-        except ValueError:
-            _LOGGER.error("Unknown System Status (%s)", self.data["device_fault"])
-            return SystemStatus.Unknown
+# enum members by value, a lookup is much cheaper than calling the enum
+_ENUM_MEMBERS = {
+    enum_class: {member.value: member for member in enum_class}
+    for enum_class in (Status, SystemStatus, PowerMode_V1)
+}
 
-    @property
-    def dry_left_time(self) -> int:
-        """Dry Left Time"""
-        return self.data["dry_left_time"]
 
-    @property
-    def is_warming_up(self) -> bool:
-        """Is Warming Up"""
-        return self.data["is_warming_up"]
+def _decode(enum_class, value: Any, label: str):
+    """Return the enum member of a value, None if it was not polled."""
+    if value is None:
+        return None
+
+    member = _ENUM_MEMBERS[enum_class].get(value)
+    if member is None:
+        _LOGGER.error("Unknown %s (%s)", label, value)
+        return getattr(enum_class, "Unknown", None)
+
+    return member
+
+
+class _PollAbandoned(Exception):
+    """The caller which sent a shared poll was cancelled before it was done."""
+
+
+class HumidifierStatusMiot(NamedTuple):
+    """Status of a Xiaomi Smart Humidifier/Dehumidifier at one poll.
+
+    Immutable and built once per poll with the enums already decoded, so the
+    entities read plain fields. Properties which were not polled are None and
+    missing from data.
+    """
+    # property name -> value, as merged from the results of get_properties:
+    # {'did': 'status', 'siid': 2, 'piid': 1, 'code': 0, 'value': 0}
+    data: Mapping[str, Any]
+    # monotonic time of the poll, None for values restored from an earlier run
+    fetched_at: Optional[float]
+    is_on: Optional[bool]
+    status: Optional[Status]
+    power_mode: Optional[PowerMode_V1]
+    mode: Optional[str]
+    system_status: Optional[SystemStatus]
+    system_status_name: Optional[str]
+    temperature: Optional[int]
+    relative_humidity: Optional[int]
+    target_humidity: Optional[int]
+    indicator_light: Optional[bool]
+    alarm: Optional[bool]
+    dry_after_off: Optional[bool]
+    light_mode: Optional[int]
+    physical_controls_locked: Optional[bool]
+    off_delay_time: Optional[int]
+    dry_left_time: Optional[int]
+    is_warming_up: Optional[bool]
+
+    @classmethod
+    def from_values(
+        cls, data: Dict[str, Any], fetched_at: Optional[float] = None
+    ) -> "HumidifierStatusMiot":
+        """Decode the property values of a poll, data must not be changed afterwards."""
+        get = data.get
+        power_mode = _decode(PowerMode_V1, get("mode"), "Power Mode")
+        system_status = _decode(SystemStatus, get("device_fault"), "System Status")
+        return cls(
+            data=MappingProxyType(data),
+            fetched_at=fetched_at,
+            is_on=get("status"),
+            status=_decode(Status, get("status"), "Status"),
+            power_mode=power_mode,
+            mode=None if power_mode is None else power_mode.name,
+            system_status=system_status,
+            system_status_name=None if system_status is None else system_status.name,
+            temperature=get("temperature"),
+            relative_humidity=get("relative_humidity"),
+            target_humidity=get("target_humidity"),
+            indicator_light=get("indicator_light"),
+            alarm=get("alarm"),
+            dry_after_off=get("dry_after_off"),
+            light_mode=get("light_mode"),
+            physical_controls_locked=get("physical_controls_locked"),
+            off_delay_time=get("off_delay_time"),
+            dry_left_time=get("dry_left_time"),
+            is_warming_up=get("is_warming_up"),
+        )
 
 
 class HumidifierMiot(MiotDevice):
     """Interface for Smart Humidifier/Dehumidifie Miot"""
-    mapping = MIOT_MAPPING[MODEL_DMAKER_DERH_22HT]
 
     def __init__(
         self,
@@ -221,12 +328,98 @@ class HumidifierMiot(MiotDevice):
         debug: int = 0,
         lazy_discover: bool = True,
         model: str = MODEL_DMAKER_DERH_22HT,
+        transport: Optional[MiioTransport] = None,
     ) -> None:
+        layout = model
         if model not in MIOT_MAPPING:
-            raise DeviceException("Invalid HumidifierMiot model: %s" % model)
-
+            _LOGGER.warning(
+                "No mapping known for %s, using the one of %s until it is probed",
+                model,
+                MODEL_DMAKER_DERH_22HT
+            )
+            layout = MODEL_DMAKER_DERH_22HT
+
+        # set before MiotDevice checks for it, set_capabilities replaces it
+        self.mapping = MIOT_MAPPING[layout]
         super().__init__(ip, token, start_id, debug, lazy_discover)
         self._model = model
+        self._async_protocol = AsyncMiioProtocol(ip, token, start_id, transport=transport)
+        self._queue = CommandQueue()
+        self._writes = WriteCoalescer(self.async_write_properties)
+        # wanted properties and result of the poll queued or in flight
+        self._poll: Optional[Tuple[Optional[FrozenSet[str]], asyncio.Future]] = None
+        # seconds a polled value is served without asking the device again
+        self.cache_age = 0.0
+        self._values: Dict[str, Any] = {}
+        self._fetched_at: Dict[str, float] = {}
+        self._failures: Dict[str, int] = {}
+        self.unsupported: Set[str] = set()
+        self.set_capabilities(layout, ())
+
+    def set_capabilities(self, layout: str, unsupported: Iterable[str]) -> None:
+        """Use the mapping of a model and stop polling the unsupported properties."""
+        # resolved once per instance, the mapping is still used by the miio commands
+        self.layout = layout
+        self.mapping = MIOT_MAPPING[layout]
+        self.tables = MIOT_TABLES[layout]
+        self.unsupported = set(unsupported)
+        self._max_age = {
+            name: max_age
+            for name, max_age in self.tables.max_age.items()
+            if name not in self.unsupported
+        }
+
+    async def async_probe(
+        self, layouts: Optional[Iterable[str]] = None
+    ) -> Tuple[str, List[str]]:
+        """Find the mapping which fits the device and the properties it rejects.
+
+        Unknown models are tried with the mappings of all known models, and
+        only the given mappings if the mapping of the model is known. The
+        device is switched to the mapping found, and the values read by the
+        probe become the last known ones.
+        """
+        best = None
+        best_response = []
+        fetched_at = None
+        for layout in layouts or self._probe_candidates():
+            now = monotonic()
+            response = await self.async_get_properties(list(MIOT_TABLES[layout].payload))
+            picked = self._pick_layout(best, layout, response)
+            if picked is not best:
+                best, best_response, fetched_at = picked, response, now
+            if not best[1]:
+                break
+
+        self.set_capabilities(*best)
+        self._status_update(fetched_at, best_response)
+        return best
+
+    def _probe_candidates(self) -> List[str]:
+        """Return the mappings to probe the device with."""
+        if self._model in MIOT_TABLES:
+            return [self._model]
+
+        return list(MIOT_TABLES)
+
+    def _pick_layout(
+        self,
+        best: Optional[Tuple[str, List[str]]],
+        layout: str,
+        response: List[Dict[str, Any]]
+    ) -> Tuple[str, List[str]]:
+        """Return the mapping with the fewest properties rejected so far."""
+        reverse = MIOT_TABLES[layout].reverse
+        unsupported = [
+            reverse[(prop.get("siid"), prop.get("piid"))]
+            for prop in response
+            if prop.get("code") != 0 and (prop.get("siid"), prop.get("piid")) in reverse
+        ]
+        _LOGGER.debug("Probed %s with the mapping of %s: %s", self.ip, layout, unsupported)
+        if best is None or len(unsupported) < len(best[1]):
+            return (layout, unsupported)
+
+        return best
 
     @command(
         default_output=format_output(
@@ -234,14 +427,246 @@ class HumidifierMiot(MiotDevice):
             "Status: {result.status.name}\n"
         )
     )
-    def status(self) -> HumidifierStatusMiot:
-        """Retrieve properties."""
-        return HumidifierStatusMiot(
-            {
-                prop["did"]: prop["value"] if prop["code"] == 0 else None
-                for prop in self.get_properties_for_mapping()
-            }
-        )
+    def status(self, wanted: Optional[Iterable[str]] = None) -> HumidifierStatusMiot:
+        """Retrieve the due properties, merged with the last known values of the others.
+
+        If wanted is given only those properties are polled.
+        """
+        now = monotonic()
+        properties = self._status_request(now, wanted)
+        if properties:
+            self._status_update(now, self.get_properties(
+                properties, property_getter="get_properties", max_properties=MAX_PROPERTIES
+            ))
+
+        return HumidifierStatusMiot.from_values(dict(self._values), now)
+
+    async def async_status(self, wanted: Optional[Iterable[str]] = None) -> HumidifierStatusMiot:
+        """Retrieve the due properties, without blocking a thread.
+
+        Polls wait behind the writes and actions sent to the device. A poll
+        made while another one is queued or in flight gets the result of that
+        one instead of asking the device twice, if it wants no other
+        properties. If the caller of that poll is cancelled, a caller which
+        joined it sends the poll instead. Values younger than the cache age
+        are not polled again.
+        """
+        wanted = None if wanted is None else frozenset(wanted)
+        poll = self._poll
+        while poll is not None and (
+            poll[0] is None or (wanted is not None and wanted <= poll[0])
+        ):
+            try:
+                return await asyncio.shield(poll[1])
+            except _PollAbandoned:
+                poll = self._poll
+
+        future = asyncio.get_running_loop().create_future()
+        self._poll = (wanted, future)
+        try:
+            async with self._queue.async_slot(PRIORITY_POLL):
+                # the due properties are picked when the device is free
+                now = monotonic()
+                properties = self._status_request(now, wanted)
+                if properties:
+                    self._status_update(now, await self._async_get_properties(properties))
+        except BaseException as ex:
+            # raised here, the polls which joined this one see it too
+            future.set_exception(
+                _PollAbandoned() if isinstance(ex, asyncio.CancelledError) else ex
+            )
+            future.exception()
+            raise
+        finally:
+            if self._poll is not None and self._poll[1] is future:
+                self._poll = None
+
+        status = HumidifierStatusMiot.from_values(dict(self._values), now)
+        future.set_result(status)
+        return status
+
+    def _status_request(
+        self, now: float, wanted: Optional[Iterable[str]]
+    ) -> List[Dict[str, Any]]:
+        """Return the payload of the due properties."""
+        read = self.tables.read
+        return [
+            read[name]
+            for name in self._due_properties(now)
+            if wanted is None or name in wanted
+        ]
+
+    def _status_update(self, now: float, response: List[Dict[str, Any]]) -> None:
+        """Merge polled properties into the last known values."""
+        reverse = self.tables.reverse
+        for prop in response:
+            name = reverse.get((prop.get("siid"), prop.get("piid")))
+            if name is None:
+                continue
+            if prop.get("code") == 0:
+                self._values[name] = prop.get("value")
+                self._fetched_at[name] = now
+                self._failures.pop(name, None)
+            else:
+                self._values[name] = None
+                self._prune_failing(name)
+
+    def _due_properties(self, now: float) -> List[str]:
+        """Return the properties whose last known value is too old."""
+        due = []
+        fetched = self._fetched_at
+        cache_age = self.cache_age
+        for name, max_age in self._max_age.items():
+            fetched_at = fetched.get(name)
+            if fetched_at is None or (
+                max_age is not None and now - fetched_at >= max(max_age, cache_age)
+            ):
+                due.append(name)
+
+        return due
+
+    def _prune_failing(self, name: str) -> None:
+        """Stop polling a property which the device keeps rejecting."""
+        failures = self._failures[name] = self._failures.get(name, 0) + 1
+        if failures >= MAX_PROPERTY_FAILURES and name in self._max_age:
+            _LOGGER.info("%s keeps rejecting %s, no longer polling it", self.ip, name)
+            del self._max_age[name]
+            self.unsupported.add(name)
+
+    def set_property(self, property_key: str, value):
+        """Set a property and poll it again with the next status."""
+        prop = self._write_request(property_key)
+        result = self.send("set_properties", [{**prop, "value": value}])
+        self._fetched_at.pop(property_key, None)
+        return result
+
+    def call_action(self, name: str, params=None):
+        """Call an action, it may change any property so poll them all again."""
+        action = self._action_request(name)
+        result = self.send("action", {**action, "in": params or []})
+        self._fetched_at.clear()
+        return result
+
+    async def async_set_property(self, property_key: str, value):
+        """Set a property, without blocking a thread.
+
+        Writes made shortly after each other are merged into one request, the
+        result is the one of this property in it.
+        """
+        self._write_request(property_key)
+        result = await self._writes.async_write(property_key, value)
+        # a device which leaves the property out of its answer did not set it
+        return [result if result is not None else {"did": property_key, "code": -1}]
+
+    async def async_write_properties(self, values: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        """Set properties by name in one request, return the result of each."""
+        request = [{**self._write_request(name), "value": value} for name, value in values.items()]
+        response = await self.async_set_properties(request)
+        for name in values:
+            self._fetched_at.pop(name, None)
+
+        reverse = self.tables.reverse
+        return {
+            reverse.get((prop.get("siid"), prop.get("piid"))): prop
+            for prop in response
+            if isinstance(prop, dict)
+        }
+
+    async def async_call_action(self, name: str, params=None):
+        """Call an action, without blocking a thread."""
+        action = self._action_request(name)
+        result = await self.async_action(action, params)
+        self._fetched_at.clear()
+        return result
+
+    async def async_on(self):
+        """Turn on, without blocking a thread."""
+        return await self.async_set_property("status", True)
+
+    async def async_off(self):
+        """Turn off, without blocking a thread."""
+        return await self.async_set_property("status", False)
+
+    async def async_send(
+        self, command: str, parameters: Any = None, priority: int = PRIORITY_COMMAND
+    ) -> Any:
+        """Send a command over the asyncio transport, when the device is free."""
+        async with self._queue.async_slot(priority):
+            return await self._async_protocol.async_send(command, parameters)
+
+    async def async_get_properties(
+        self, properties: List[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """Request properties, at most MAX_PROPERTIES per request."""
+        async with self._queue.async_slot(PRIORITY_POLL):
+            return await self._async_get_properties(properties)
+
+    async def _async_get_properties(
+        self, properties: List[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """Request properties while holding the turn of the device."""
+        response = []
+        for start in range(0, len(properties), MAX_PROPERTIES):
+            response.extend(await self._async_protocol.async_send(
+                "get_properties", properties[start:start + MAX_PROPERTIES]
+            ))
+
+        return response
+
+    async def async_set_properties(self, properties: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Set properties given as siid, piid and value."""
+        return await self.async_send("set_properties", properties)
+
+    async def async_action(self, action: Dict[str, Any], params=None) -> Dict[str, Any]:
+        """Call an action given as siid and aiid."""
+        return await self.async_send("action", {**action, "in": params or []})
+
+    async def async_info(self) -> DeviceInfo:
+        """Return the miIO info of the device."""
+        return DeviceInfo(await self.async_send("miIO.info", priority=PRIORITY_BACKGROUND))
+
+    def apply_values(self, values: Mapping[str, Any]) -> HumidifierStatusMiot:
+        """Take written values as the last known ones until they are polled again."""
+        self._values.update(values)
+        return HumidifierStatusMiot.from_values(dict(self._values), monotonic())
+
+    def known_status(self) -> HumidifierStatusMiot:
+        """Return the last known values as a status, without polling."""
+        return HumidifierStatusMiot.from_values(dict(self._values), monotonic())
+
+    def restore_status(self, values: Dict[str, Any]) -> HumidifierStatusMiot:
+        """Start from the values of an earlier run, all are polled again."""
+        self._values.update(values)
+        return HumidifierStatusMiot.from_values(dict(self._values))
+
+    def session(self) -> Optional[Dict[str, Any]]:
+        """Return the handshake state of the asyncio transport, None before one."""
+        return self._async_protocol.session()
+
+    def restore_session(self, session: Dict[str, Any]) -> None:
+        """Continue the handshake state of an earlier run."""
+        self._async_protocol.restore_session(session)
+
+    async def async_close(self) -> None:
+        """Drop the pending writes and close the asyncio transport."""
+        self._writes.cancel()
+        await self._async_protocol.async_close()
+
+    def _write_request(self, property_key: str) -> Dict[str, Any]:
+        """Return the payload of a writable property."""
+        prop = self.tables.write.get(property_key)
+        if prop is None:
+            raise DeviceException("Property %s is not writable" % property_key)
+
+        return prop
+
+    def _action_request(self, name: str) -> Dict[str, Any]:
+        """Return the payload of an action."""
+        action = self.tables.actions.get(name)
+        if action is None:
+            raise DeviceException("Unable to find action %s" % name)
+
+        return action
 
     @command(
         click.argument("mode", type=int),
@@ -0,0 +1,397 @@
+"""Asyncio miIO transport of the Xiaomi Smart Humidifier/Dehumidifier component."""
+# pylint: disable=import-error
+import asyncio
+import logging
+import socket
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+import construct
+from miio import DeviceException
+from miio.exceptions import DeviceError, RecoverableError
+from miio.protocol import Message
+
+_LOGGER = logging.getLogger(__name__)
+
+MIIO_PORT = 54321
+# magic, length 32
+HELLO_BYTES = bytes.fromhex(
+    "21310020ffffffffffffffffffffffffffffffffffffffffffffffffffffffff"
+)
+MAGIC = bytes.fromhex("2131")
+HEADER_LENGTH = 32
+HELLO_LENGTH = 32
+HELLO_LENGTH_BYTES = HELLO_LENGTH.to_bytes(2, "big")
+# datagrams sent to all devices per second, after a burst of SEND_BURST
+SEND_RATE = 500
+SEND_BURST = 100
+# message ids wrap around before this value
+MAX_MESSAGE_ID = 9999
+DEFAULT_TIMEOUT = 5
+RECOVERABLE_ERRORS = (-30001, -9999)
+# replies carry no id for the handshake
+HANDSHAKE_ID = -1
+
+
+class MiioTransport(asyncio.DatagramProtocol):
+    """One UDP socket shared by all devices.
+
+    Replies are routed to the device by the device id in their header, and
+    to the waiting request by their message id. Handshake replies carry no
+    message id and are routed by the address of the device. The datagrams
+    sent to the whole fleet are spread out to a maximum rate, waiting for a
+    reply does not count, so devices which do not answer hold up no others.
+    """
+
+    def __init__(self, rate: float = SEND_RATE, burst: int = SEND_BURST) -> None:
+        """Initialize the transport."""
+        self.transport: Optional[asyncio.DatagramTransport] = None
+        self._by_id: Dict[bytes, "AsyncMiioProtocol"] = {}
+        self._by_addr: Dict[Tuple[str, int], "AsyncMiioProtocol"] = {}
+        self._interval = 1 / rate
+        self._burst_time = burst / rate
+        # the time the next datagram is due at the maximum rate
+        self._send_at = 0.0
+        self._start_lock = asyncio.Lock()
+
+    async def async_start(self) -> None:
+        """Open the socket once."""
+        async with self._start_lock:
+            if self.transport is None:
+                loop = asyncio.get_running_loop()
+                try:
+                    await loop.create_datagram_endpoint(lambda: self, local_addr=("0.0.0.0", 0))
+                except OSError as ex:
+                    raise DeviceException(f"Unable to open the miIO socket: {ex}") from ex
+
+    def close(self) -> None:
+        """Close the socket, pending requests fail."""
+        if self.transport is not None:
+            self.transport.close()
+
+    def register(self, device: "AsyncMiioProtocol") -> None:
+        """Route the replies from the address and device id of a device to it."""
+        self._by_addr[device.addr] = device
+        if device.device_id:
+            self._by_id[device.device_id] = device
+
+    def unregister(self, device: "AsyncMiioProtocol") -> None:
+        """Stop routing replies to a device."""
+        if self._by_addr.get(device.addr) is device:
+            del self._by_addr[device.addr]
+        if self._by_id.get(device.device_id) is device:
+            del self._by_id[device.device_id]
+
+    async def async_request(
+        self, device: "AsyncMiioProtocol", message_id: int, data: bytes, timeout: float
+    ) -> Optional[Message]:
+        """Send a datagram to a device and wait for its reply, None if it timed out."""
+        await self.async_start()
+        await self._async_wait_send_turn()
+        if self.transport is None:
+            raise DeviceException("The miIO socket was closed")
+
+        future = device.expect(message_id)
+        try:
+            self.transport.sendto(data, device.addr)
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return None
+        except OSError as ex:
+            raise DeviceException(f"Failed to send to {device.ip}: {ex}") from ex
+        finally:
+            device.forget(message_id)
+
+    async def _async_wait_send_turn(self) -> None:
+        """Wait until a datagram may be sent, in the order of the callers."""
+        now = asyncio.get_running_loop().time()
+        self._send_at = max(self._send_at, now) + self._interval
+        delay = self._send_at - self._burst_time - now
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        """Keep the transport of the bound socket."""
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr: Tuple[str, int]) -> None:
+        """Hand a reply to the device which sent it."""
+        if len(data) < HEADER_LENGTH or data[:2] != MAGIC:
+            _LOGGER.debug("Ignoring malformed datagram from %s", addr[0])
+            return
+
+        device = None
+        if data[2:4] != HELLO_LENGTH_BYTES:
+            device = self._by_id.get(data[8:12])
+        # devices sharing an id, e.g. after a factory reset, are told apart by address
+        if device is None or device.addr != addr[:2]:
+            device = self._by_addr.get(addr[:2])
+        if device is None:
+            _LOGGER.debug("Ignoring datagram from unknown device %s", addr[0])
+            return
+
+        device.datagram_received(data, addr)
+
+    def error_received(self, exc: Exception) -> None:
+        """Log socket errors, the requests concerned time out."""
+        _LOGGER.debug("Error on the miIO socket: %s", exc)
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        """Fail the pending requests of all devices when the socket is closed."""
+        self.transport = None
+        for device in set(self._by_addr.values()) | set(self._by_id.values()):
+            device.fail_pending(DeviceException("The miIO socket was closed"))
+
+
+class AsyncMiioProtocol:
+    """Send miIO commands to one device without blocking a thread.
+
+    The counterpart of miio.MiIOProtocol on a MiioTransport of the event loop,
+    which is shared with the other devices if given. The handshake is done
+    lazily and again after a request timed out.
+    """
+
+    def __init__(
+        self,
+        ip: str,
+        token: str = None,
+        start_id: int = 0,
+        timeout: float = DEFAULT_TIMEOUT,
+        port: int = MIIO_PORT,
+        transport: Optional[MiioTransport] = None
+    ) -> None:
+        """Initialize the protocol."""
+        self.ip = ip
+        self.port = port
+        self.addr: Tuple[str, int] = (ip, port)
+        self.token = bytes.fromhex(token or 32 * "0")
+        self.device_id = bytes()
+        self._timeout = timeout
+        self._id = start_id
+        self._discovered = False
+        self._device_ts = datetime.utcnow()
+        self._ts_offset = 0
+        self._transport = transport
+        self._owns_transport = transport is None
+        self._registered = False
+        self._closed = False
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._connect_lock = asyncio.Lock()
+        self._handshake_lock = asyncio.Lock()
+
+    def session(self) -> Optional[Dict[str, Any]]:
+        """Return what is needed to skip the handshake next time, None before one."""
+        if not self._discovered:
+            return None
+
+        return {"device_id": self.device_id.hex(), "ts_offset": self._ts_offset, "id": self._id}
+
+    def restore_session(self, session: Dict[str, Any]) -> None:
+        """Continue the session of an earlier run without a handshake.
+
+        A device which does not accept it does not answer, and the retry of the
+        request does a handshake.
+        """
+        self.device_id = bytes.fromhex(session["device_id"])
+        self._ts_offset = session["ts_offset"]
+        self._device_ts = datetime.utcnow() + timedelta(seconds=self._ts_offset)
+        self._id = session["id"] % MAX_MESSAGE_ID
+        self._discovered = True
+
+    async def async_close(self) -> None:
+        """Stop using the transport, it is closed unless shared."""
+        self._closed = True
+        self.fail_pending(DeviceException("The connection to the device was closed"))
+        if self._transport is not None:
+            self._transport.unregister(self)
+            if self._owns_transport:
+                self._transport.close()
+                self._transport = None
+        self._registered = False
+        self._discovered = False
+
+    def expect(self, message_id: int) -> asyncio.Future:
+        """Return a future resolved with the reply to a message id."""
+        future = asyncio.get_running_loop().create_future()
+        self._pending[message_id] = future
+        return future
+
+    def forget(self, message_id: int) -> None:
+        """Stop waiting for the reply to a message id."""
+        self._pending.pop(message_id, None)
+
+    def fail_pending(self, exc: Exception) -> None:
+        """Raise an exception in all pending requests."""
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(exc)
+        self._pending.clear()
+
+    def datagram_received(self, data: bytes, addr: Tuple[str, int]) -> None:
+        """Parse a reply and resolve the request with its message id."""
+        try:
+            message = Message.parse(data, token=self.token)
+        except construct.core.ChecksumError:
+            _LOGGER.warning(
+                "Got checksum error from %s which indicates use of an invalid token", addr[0]
+            )
+            self.fail_pending(DeviceException(
+                "Got checksum error which indicates use of an invalid token. "
+                "Please check your token!"
+            ))
+            return
+        except construct.ConstructError as ex:
+            _LOGGER.debug("Ignoring malformed datagram from %s: %s", addr[0], ex)
+            return
+
+        if message.header.value.length == HELLO_LENGTH:
+            message_id = HANDSHAKE_ID
+        elif isinstance(message.data.value, dict):
+            message_id = message.data.value.get("id")
+        else:
+            _LOGGER.debug("Ignoring undecryptable datagram from %s", addr[0])
+            return
+
+        future = self._pending.get(message_id)
+        if future is None or future.done():
+            _LOGGER.debug("Ignoring late reply %s from %s", message_id, addr[0])
+            return
+
+        future.set_result(message)
+
+    async def async_send_handshake(self) -> Message:
+        """Send a handshake, its reply carries the device id and timestamp."""
+        async with self._handshake_lock:
+            if self._discovered:
+                return None
+
+            transport = await self._async_connect()
+            message = None
+            for _ in range(3):
+                message = await transport.async_request(
+                    self, HANDSHAKE_ID, HELLO_BYTES, self._timeout
+                )
+                if message is not None:
+                    break
+
+            if message is None:
+                _LOGGER.debug("Unable to discover a device at address %s", self.ip)
+                raise DeviceException("Unable to discover the device %s" % self.ip)
+
+            header = message.header.value
+            if self.device_id != header.device_id:
+                transport.unregister(self)
+                self.device_id = bytes(header.device_id)
+                transport.register(self)
+            self._set_device_ts(header.ts)
+            self._discovered = True
+            _LOGGER.debug(
+                "Discovered %s with ts: %s", self.device_id.hex(), self._device_ts
+            )
+            return message
+
+    async def async_send(
+        self,
+        command: str,
+        parameters: Any = None,
+        retry_count: int = 3,
+        *,
+        extra_parameters: Dict = None
+    ) -> Any:
+        """Send a command and return its result.
+
+        Timed out requests are retried after a new handshake with the message
+        id incremented by 100, like miio does.
+
+        :raises DeviceException: if an error has occurred during communication.
+        """
+        if not self._discovered:
+            await self.async_send_handshake()
+
+        request = {
+            "id": self._next_id(),
+            "method": command,
+            "params": [] if parameters is None else parameters
+        }
+        if extra_parameters is not None:
+            request = {**request, **extra_parameters}
+
+        header = {
+            "length": 0,
+            "unknown": 0x00000000,
+            "device_id": self.device_id,
+            "ts": self._device_ts + timedelta(seconds=1),
+        }
+        data = Message.build(
+            {"data": {"value": request}, "header": {"value": header}, "checksum": 0},
+            token=self.token
+        )
+        _LOGGER.debug("%s:%s >>: %s", self.ip, self.port, request)
+
+        transport = await self._async_connect()
+        message = await transport.async_request(self, request["id"], data, self._timeout)
+        if message is None:
+            if retry_count > 0:
+                _LOGGER.debug("Retrying with incremented id, retries left: %s", retry_count)
+                self._id += 100
+                self._discovered = False
+                return await self.async_send(
+                    command, parameters, retry_count - 1, extra_parameters=extra_parameters
+                )
+
+            raise DeviceException("No response from the device")
+
+        payload = message.data.value
+        self._set_device_ts(message.header.value.ts)
+        _LOGGER.debug("%s:%s (id: %s) << %s", self.ip, self.port, payload["id"], payload)
+
+        if "error" in payload:
+            error = payload["error"]
+            if error.get("code") in RECOVERABLE_ERRORS and retry_count > 0:
+                _LOGGER.debug("Retrying to send failed command, retries left: %s", retry_count)
+                return await self.async_send(
+                    command, parameters, retry_count - 1, extra_parameters=extra_parameters
+                )
+            if error.get("code") in RECOVERABLE_ERRORS:
+                raise DeviceException("Unable to recover failed command") from RecoverableError(
+                    error
+                )
+            raise DeviceError(error)
+
+        return payload.get("result", payload)
+
+    def _next_id(self) -> int:
+        """Increment and return the message id."""
+        self._id += 1
+        if self._id >= MAX_MESSAGE_ID:
+            self._id = 1
+        return self._id
+
+    def _set_device_ts(self, device_ts: datetime) -> None:
+        """Keep the timestamp of the device and its offset to the local clock."""
+        self._device_ts = device_ts
+        self._ts_offset = round((device_ts - datetime.utcnow()).total_seconds())
+
+    async def _async_connect(self) -> MiioTransport:
+        """Resolve the address of the device and register it with the transport once."""
+        if self._closed:
+            raise DeviceException("The connection to the device was closed")
+
+        async with self._connect_lock:
+            if self._transport is None:
+                self._transport = MiioTransport()
+                self._owns_transport = True
+
+            if not self._registered:
+                loop = asyncio.get_running_loop()
+                try:
+                    infos = await loop.getaddrinfo(
+                        self.ip, self.port, family=socket.AF_INET, type=socket.SOCK_DGRAM
+                    )
+                except OSError as ex:
+                    raise DeviceException(f"Unable to resolve {self.ip}: {ex}") from ex
+                self.addr = infos[0][4][:2]
+                self._transport.register(self)
+                self._registered = True
+
+            return self._transport
@@ -0,0 +1,99 @@
+"""Adaptive polling of the Xiaomi Smart Humidifier/Dehumidifier component."""
+from collections import deque
+from time import monotonic
+from typing import Any, Dict, Optional
+
+from .humidifier_miot import PowerMode_V1
+
+# number of recent polls used to estimate the change rate
+CHANGE_WINDOW = 6
+# growth of the interval per unchanged poll, while on and while off
+BACKOFF_FACTOR = 1.5
+BACKOFF_FACTOR_OFF = 2.0
+# seconds to poll at the minimum interval after a command
+COMMAND_BOOST_TIME = 30
+
+# the settings and timers the activity of a device is judged by, the readings
+# of the room jitter on nearly every poll and are left out
+ACTIVITY_PROPERTIES = (
+    "status", "mode", "target_humidity", "off_delay_time", "dry_left_time", "is_warming_up"
+)
+
+
+class AdaptivePollScheduler:
+    """Pick the next poll interval of a device from its recent activity.
+
+    Devices which are drying clothes, warming up or counting down their dry
+    time are polled at the minimum interval, as are devices which just got a
+    command. Devices whose settings or timers keep changing are polled between
+    the minimum and the configured scan interval, depending on how often they
+    changed. Idle devices back off exponentially up to the maximum interval,
+    however their humidity and temperature readings jitter.
+    """
+
+    def __init__(self, scan_interval: float, min_interval: float, max_interval: float) -> None:
+        """Initialize the scheduler."""
+        self.set_bounds(scan_interval, min_interval, max_interval)
+        self._changes = deque(maxlen=CHANGE_WINDOW)
+        self._last_data: Optional[Dict[str, Any]] = None
+        self._boost_until = 0.0
+
+    @property
+    def interval(self) -> float:
+        """Return the current poll interval in seconds."""
+        return self._interval
+
+    def set_bounds(self, scan_interval: float, min_interval: float, max_interval: float) -> None:
+        """Set the interval bounds, the scan interval is kept within them."""
+        self.min_interval = min(min_interval, max_interval)
+        self.max_interval = max(min_interval, max_interval)
+        self.scan_interval = min(max(scan_interval, self.min_interval), self.max_interval)
+        self._interval = self.scan_interval
+
+    def note_command(self) -> float:
+        """Poll at the minimum interval for a while after a command."""
+        self._boost_until = monotonic() + COMMAND_BOOST_TIME
+        self._interval = self.min_interval
+        return self._interval
+
+    def note_failure(self) -> float:
+        """Fall back to the scan interval while the device does not answer."""
+        self._interval = self.scan_interval
+        return self._interval
+
+    def next_interval(self, data: Dict[str, Any]) -> float:
+        """Record a polled status and return the interval until the next poll."""
+        is_on = bool(data.get("status"))
+        self._changes.append(self._has_changed(data))
+        self._last_data = data
+
+        if monotonic() < self._boost_until or _is_active(data):
+            self._interval = self.min_interval
+        elif any(self._changes):
+            rate = sum(self._changes) / len(self._changes)
+            self._interval = max(self.min_interval, self.scan_interval * (1 - rate))
+        else:
+            factor = BACKOFF_FACTOR if is_on else BACKOFF_FACTOR_OFF
+            self._interval = min(
+                self.max_interval, max(self._interval, self.scan_interval) * factor
+            )
+
+        return self._interval
+
+    def _has_changed(self, data: Dict[str, Any]) -> bool:
+        """Return true if a setting or timer differs from the previous poll."""
+        if self._last_data is None:
+            return False
+
+        return any(
+            self._last_data.get(key) != data.get(key) for key in ACTIVITY_PROPERTIES
+        )
+
+
+def _is_active(data: Dict[str, Any]) -> bool:
+    """Return true if the device is in a quickly changing phase."""
+    # drying after off counts down while the device is off
+    if data.get("dry_left_time") or data.get("is_warming_up"):
+        return True
+
+    return bool(data.get("status")) and data.get("mode") == PowerMode_V1.Clothes_Drying.value
@@ -1,23 +1,33 @@
 """Support for Xiaomi Smart Humidifier/Dehumidifier service."""
 import logging
-from datetime import timedelta
+from time import monotonic
 
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.components.sensor import SensorEntity
 from homeassistant.helpers.typing import ConfigType
 from homeassistant.helpers import device_registry as dr
+from homeassistant.helpers.update_coordinator import CoordinatorEntity
 from homeassistant.const import (
-    CONF_HOST,
-    CONF_TOKEN
+    CONF_HOST
 )
-from miio import DeviceException
 
-from .humidifier_miot import SystemStatus
+from .humidifier_miot import properties_for
 from .const import (
+    ATTR_STALE,
+    CONF_DEADBAND,
+    CONF_DEADBAND_PERCENT,
+    CONF_MIN_PUBLISH_INTERVAL,
     CONF_MODEL,
-    DATA_KEY,
+    CONF_PUBLISH_HEARTBEAT,
+    DATA_COORDINATOR,
+    DATA_DEVICE,
+    DEFAULT_DEADBAND,
+    DEFAULT_DEADBAND_PERCENT,
+    DEFAULT_MIN_PUBLISH_INTERVAL,
+    DEFAULT_PUBLISH_HEARTBEAT,
     DOMAIN,
+    FILTERED_SENSORS,
     HUMIDIFIER_SENSORS,
     MODELS_MIOT,
     XiaomiHumidifierSensorDescription
@@ -25,8 +35,6 @@ from .const import (
 
 _LOGGER = logging.getLogger(__name__)
 
-SCAN_INTERVAL = timedelta(seconds=30)
-
 async def async_setup_entry(
     hass: HomeAssistant, entry: ConfigType, async_add_entities: AddEntitiesCallback
 ) -> None:
@@ -37,7 +45,8 @@ async def async_setup_entry(
     name = entry.title
     unique_id = entry.unique_id
 
-    humidifier = hass.data[DOMAIN][host]
+    humidifier = hass.data[DOMAIN][host][DATA_DEVICE]
+    coordinator = hass.data[DOMAIN][host][DATA_COORDINATOR]
 
     try:
         entities = []
@@ -45,30 +54,41 @@ async def async_setup_entry(
         for description in HUMIDIFIER_SENSORS:
             if model in MODELS_MIOT:
                 entities.extend(
-                    [XiaomiHumidifierSensor(entry.options, description, name, unique_id, humidifier)]
+                    [XiaomiHumidifierSensor(
+                        coordinator, entry.options, description, name, unique_id, humidifier)]
                 )
 
         async_add_entities(entities)
     except AttributeError as ex:
         _LOGGER.error(ex)
 
-class XiaomiHumidifierSensor(SensorEntity):
+class XiaomiHumidifierSensor(CoordinatorEntity, SensorEntity):
     """Implementation of a Xiaomi Smart Humidifier/Dehumidifier sensor."""
     entity_description: XiaomiHumidifierSensorDescription
 
-    def __init__(self, entry_data, description, name, unique_id, humidifier):
+    def __init__(self, coordinator, entry_data, description, name, unique_id, humidifier):
+        super().__init__(coordinator, context=properties_for((description.key,)))
         self.entity_description = description
         self._entry_data = entry_data
         self._name = name
         self._model = entry_data[CONF_MODEL]
         self._unique_id = unique_id
         self._attr = description.key
-        self._mac = entry_data[CONF_TOKEN]
         self._host = entry_data[CONF_HOST]
         self._humidifier = humidifier
         self._available = True
-        self._skip_update = False
         self._state = None
+        self._written_state = None
+        self._published_at = None
+        self._filtered = description.key in FILTERED_SENSORS
+        self._deadband = entry_data.get(CONF_DEADBAND.format(description.key), DEFAULT_DEADBAND)
+        self._deadband_percent = entry_data.get(
+            CONF_DEADBAND_PERCENT.format(description.key), DEFAULT_DEADBAND_PERCENT
+        )
+        self._min_publish_interval = entry_data.get(
+            CONF_MIN_PUBLISH_INTERVAL, DEFAULT_MIN_PUBLISH_INTERVAL
+        )
+        self._heartbeat = entry_data.get(CONF_PUBLISH_HEARTBEAT, DEFAULT_PUBLISH_HEARTBEAT)
         self._attr_native_unit_of_measurement = description.native_unit_of_measurement
         self._attr_device_class = description.device_class
         self._attr_state_class = description.state_class
@@ -90,47 +110,99 @@ class XiaomiHumidifierSensor(SensorEntity):
     @property
     def device_info(self):
         """Return the device info."""
-        info = self._humidifier.info()
+        info = self.coordinator.info
         device_info = {
             "identifiers": {(DOMAIN, self._unique_id)},
             "manufacturer": (self._model or "Xiaomi").split(".", 1)[0].capitalize(),
             "name": self._name,
-            "model": self._model,
-            "sw_version": info.firmware_version,
-            "hw_version": info.hardware_version
+            "model": self._model
         }
-
-        if self._mac is not None:
-            device_info["connections"] = {(dr.CONNECTION_NETWORK_MAC, self._mac)}
+        if info is not None:
+            device_info["sw_version"] = info.firmware_version
+            device_info["hw_version"] = info.hardware_version
+            if info.mac_address:
+                device_info["connections"] = {(dr.CONNECTION_NETWORK_MAC, info.mac_address)}
 
         return device_info
 
+    @property
+    def available(self) -> bool:
+        """Return whether the device answered and reported the property."""
+        return super().available and self._available
+
+    @property
+    def extra_state_attributes(self):
+        """Return the state attributes of the sensor."""
+        if self.coordinator.stale:
+            return {ATTR_STALE: True}
+
+        return None
+
     @property
     def native_value(self):
         """Return the state of the sensor."""
         return self._state
 
-    async def async_update(self):
-        """Fetch state from the device."""
-        # On state change the device doesn't provide the new state immediately.
-        if self._skip_update:
-            self._skip_update = False
-            return
-
-        try:
-            if getattr(self.hass.data[DATA_KEY][self._host], "status", None):
-                state = self.hass.data[DATA_KEY][self._host].status
+    async def async_added_to_hass(self) -> None:
+        """Handle entity which will be added."""
+        await super().async_added_to_hass()
+        self._handle_coordinator_update()
+
+    def _state_signature(self) -> tuple:
+        """Return everything the state written to Home Assistant depends on."""
+        return (self._available, self._state, self.coordinator.stale)
+
+    @callback
+    def async_write_ha_state(self) -> None:
+        """Write the state and remember it, so an unchanged one is not written again."""
+        self._written_state = self._state_signature()
+        self._published_at = monotonic()
+        super().async_write_ha_state()
+
+    def _should_publish(self) -> bool:
+        """Return whether the state changed enough to be written."""
+        signature = self._state_signature()
+        if signature == self._written_state:
+            return self._filtered and bool(self._heartbeat) and self._due(self._heartbeat)
+        if not self._filtered or self._written_state is None:
+            return True
+
+        available, value, stale = signature
+        written_available, written, written_stale = self._written_state
+        # availability and the stale flag are never held back
+        if (available, stale) != (written_available, written_stale):
+            return True
+        if self._heartbeat and self._due(self._heartbeat):
+            return True
+        if not self._due(self._min_publish_interval):
+            return False
+        if not isinstance(value, (int, float)) or not isinstance(written, (int, float)):
+            return True
+
+        deadband = max(self._deadband, abs(written) * self._deadband_percent / 100)
+        return abs(value - written) > deadband
+
+    def _due(self, interval: float) -> bool:
+        """Return whether the state was last written at least interval seconds ago."""
+        return monotonic() - self._published_at >= interval
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        """Handle updated data from the coordinator."""
+        state = self.coordinator.data
+        # properties of a newly enabled entity are missing until the next poll
+        self._available = (
+            self.coordinator.last_update_success
+            and state is not None
+            and self.coordinator_context <= state.data.keys()
+        )
+        if self._available:
+            if self._attr == "system_status":
+                # decoded once per poll by the status
+                self._state = state.system_status_name
             else:
-                state = await self.hass.async_add_executor_job(self._humidifier.status)
-            _LOGGER.debug("Got new state: %s", state)
-
-            self._available = True
-            self._state = getattr(state, self._attr, None)
-            if self.entity_description.key == "system_status":
-                self._state = SystemStatus(self._state).name
-
-        except DeviceException as ex:
-            if self._available:
-                self._available = False
-                _LOGGER.error("Got exception while fetching the state: %s", ex)
+                self._state = getattr(state, self._attr, None)
 
+        # unchanged states and changes held back by the filter are not written
+        if self._should_publish():
+            self.async_write_ha_state()
@@ -0,0 +1,74 @@
+"""Storage of the Xiaomi Smart Humidifier/Dehumidifier component."""
+import asyncio
+from typing import Any, Dict, Optional
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.storage import Store
+
+from .const import (
+    DATA_STORES,
+    DOMAIN,
+    STORAGE_SAVE_DELAY,
+    STORAGE_VERSION
+)
+
+
+class XiaomiHumidifierStore:
+    """A storage file shared by all entries, loaded once and saved lazily."""
+
+    def __init__(self, hass: HomeAssistant, key: str) -> None:
+        """Initialize the store."""
+        self._store = Store(hass, STORAGE_VERSION, f"{DOMAIN}.{key}")
+        self._data: Dict[str, Any] = {}
+
+    async def async_load(self) -> None:
+        """Load the stored data."""
+        self._data = await self._store.async_load() or {}
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Return the stored value of a key."""
+        return self._data.get(key, default)
+
+    @callback
+    def async_set(self, key: str, value: Any) -> None:
+        """Store the value of a key, the file is written after a delay."""
+        self._data[key] = value
+        self._store.async_delay_save(self._data_to_save, STORAGE_SAVE_DELAY)
+
+    @callback
+    def async_remove(self, key: str) -> None:
+        """Remove the value of a key."""
+        if self._data.pop(key, None) is not None:
+            self._store.async_delay_save(self._data_to_save, STORAGE_SAVE_DELAY)
+
+    @callback
+    def _data_to_save(self) -> Dict[str, Any]:
+        """Return the data to write."""
+        return self._data
+
+
+async def async_get_store(hass: HomeAssistant, key: str) -> XiaomiHumidifierStore:
+    """Return the store of a key, all entries share one loaded instance."""
+    stores: Dict[str, Any] = hass.data.setdefault(DATA_STORES, {})
+    store: Optional[Any] = stores.get(key)
+    if store is None:
+        # the first caller loads the file, concurrent callers wait for it
+        store = stores[key] = hass.async_create_task(_async_load_store(hass, key))
+
+    if isinstance(store, asyncio.Task):
+        return await asyncio.shield(store)
+
+    return store
+
+
+async def _async_load_store(hass: HomeAssistant, key: str) -> XiaomiHumidifierStore:
+    """Load a store and keep it for the other entries."""
+    store = XiaomiHumidifierStore(hass, key)
+    try:
+        await store.async_load()
+    except BaseException:
+        hass.data[DATA_STORES].pop(key, None)
+        raise
+
+    hass.data[DATA_STORES][key] = store
+    return store
@@ -1,26 +1,26 @@
 """Support for Xiaomi Smart Humidifier/Dehumidifier service."""
 import logging
-from datetime import timedelta
-from functools import partial
 
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.helpers.typing import ConfigType
 from homeassistant.helpers import device_registry as dr
+from homeassistant.helpers.update_coordinator import CoordinatorEntity
 from homeassistant.components.switch import (
     SwitchEntity,
     SwitchEntityDescription,
 )
 from homeassistant.const import (
-    CONF_HOST,
-    CONF_TOKEN
+    CONF_HOST
 )
 from miio import DeviceException
 
-from .humidifier_miot import SystemStatus
+from .humidifier_miot import SystemStatus, properties_for
 from .const import (
+    ATTR_STALE,
     CONF_MODEL,
-    DATA_KEY,
+    DATA_COORDINATOR,
+    DATA_DEVICE,
     DOMAIN,
     HUMIDIFIER_SWITCHS_V1,
     MODELS_MIOT
@@ -28,8 +28,6 @@ from .const import (
 
 _LOGGER = logging.getLogger(__name__)
 
-SCAN_INTERVAL = timedelta(seconds=30)
-
 async def async_setup_entry(
     hass: HomeAssistant, entry: ConfigType, async_add_entities: AddEntitiesCallback
 ) -> None:
@@ -40,7 +38,8 @@ async def async_setup_entry(
     name = entry.title
     unique_id = entry.unique_id
 
-    humidifier = hass.data[DOMAIN][host]
+    humidifier = hass.data[DOMAIN][host][DATA_DEVICE]
+    coordinator = hass.data[DOMAIN][host][DATA_COORDINATOR]
 
     try:
         entities = []
@@ -49,30 +48,31 @@ async def async_setup_entry(
             for description in HUMIDIFIER_SWITCHS_V1:
                 unique_id = "{}_{}".format(unique_id.replace(" ", "_"), description.key)
                 entities.extend(
-                    [XiaomiHumidifierSwitch(entry.options, description, name, unique_id, humidifier)]
+                    [XiaomiHumidifierSwitch(
+                        coordinator, entry.options, description, name, unique_id, humidifier)]
                 )
 
         async_add_entities(entities)
     except AttributeError as ex:
         _LOGGER.error(ex)
 
-class XiaomiHumidifierSwitch(SwitchEntity):
+class XiaomiHumidifierSwitch(CoordinatorEntity, SwitchEntity):
     """Implementation of a Xiaomi Smart Humidifier/Dehumidifier switch."""
     entity_description: SwitchEntityDescription
 
-    def __init__(self, entry_data, description, name, unique_id, humidifier):
+    def __init__(self, coordinator, entry_data, description, name, unique_id, humidifier):
+        super().__init__(coordinator, context=properties_for((description.key,)))
         self.entity_description = description
         self._entry_data = entry_data
         self._name = name
         self._model = entry_data[CONF_MODEL]
         self._unique_id = unique_id
         self._attr = description.key
-        self._mac = entry_data[CONF_TOKEN]
         self._host = entry_data[CONF_HOST]
         self._humidifier = humidifier
         self._available = True
-        self._skip_update = False
         self._state = None
+        self._written_state = None
         self._attr_device_class = description.device_class
 
     @property
@@ -92,21 +92,34 @@ class XiaomiHumidifierSwitch(SwitchEntity):
     @property
     def device_info(self):
         """Return the device info."""
-        info = self._humidifier.info()
+        info = self.coordinator.info
         device_info = {
             "identifiers": {(DOMAIN, self._unique_id)},
             "manufacturer": (self._model or "Xiaomi").split(".", 1)[0].capitalize(),
             "name": self._name,
-            "model": self._model,
-            "sw_version": info.firmware_version,
-            "hw_version": info.hardware_version
+            "model": self._model
         }
-
-        if self._mac is not None:
-            device_info["connections"] = {(dr.CONNECTION_NETWORK_MAC, self._mac)}
+        if info is not None:
+            device_info["sw_version"] = info.firmware_version
+            device_info["hw_version"] = info.hardware_version
+            if info.mac_address:
+                device_info["connections"] = {(dr.CONNECTION_NETWORK_MAC, info.mac_address)}
 
         return device_info
 
+    @property
+    def available(self) -> bool:
+        """Return whether the device answered and reported the property."""
+        return super().available and self._available
+
+    @property
+    def extra_state_attributes(self):
+        """Return the state attributes of the switch."""
+        if self.coordinator.stale:
+            return {ATTR_STALE: True}
+
+        return None
+
     @property
     def is_on(self) -> bool:
         """Return the state of the switch."""
@@ -115,13 +128,15 @@ class XiaomiHumidifierSwitch(SwitchEntity):
     async def _try_command(self, mask_error, func, *args, **kwargs):
         """Call a humidifier command handling error messages."""
         try:
-            result = await self.hass.async_add_executor_job(
-                partial(func, *args, **kwargs)
-            )
+            result = await func(*args, **kwargs)
 
             _LOGGER.debug("Response received from humidifier: %s", result)
 
-            return result[0].get('code', -1) == 0
+            success = result[0].get('code', -1) == 0
+            if success:
+                self.coordinator.async_note_command()
+
+            return success
         except DeviceException as exc:
             if self._available:
                 _LOGGER.error(mask_error, exc)
@@ -133,43 +148,52 @@ class XiaomiHumidifierSwitch(SwitchEntity):
         """Turn the humidifier on."""
         result = await self._try_command(
             "Turning the humidifier switch on failed.",
-            self._humidifier.set_switch_on,
-            self._attr)
+            self._humidifier.async_set_property,
+            self._attr,
+            True)
 
         if result:
-            self._state = True
-            self._skip_update = True
+            self.coordinator.async_apply_write({self._attr: True})
 
     async def async_turn_off(self, **kwargs):
         """Turn the humidifier off."""
         result = await self._try_command(
             "Turning the humidifier off failed.",
-            self._humidifier.set_switch_off,
-            self._attr)
+            self._humidifier.async_set_property,
+            self._attr,
+            False)
 
         if result:
-            self._state = False
-            self._skip_update = True
-
-    async def async_update(self):
-        """Fetch state from the device."""
-        # On state change the device doesn't provide the new state immediately.
-        if self._skip_update:
-            self._skip_update = False
-            return
-
-        try:
-            if getattr(self.hass.data[DATA_KEY][self._host], "status", None):
-                state = self.hass.data[DATA_KEY][self._host].status
-            else:
-                state = await self.hass.async_add_executor_job(self._humidifier.status)
-            _LOGGER.debug("Got new state: %s", state)
-
-            self._available = True
+            self.coordinator.async_apply_write({self._attr: False})
+
+    async def async_added_to_hass(self) -> None:
+        """Handle entity which will be added."""
+        await super().async_added_to_hass()
+        self._handle_coordinator_update()
+
+    def _state_signature(self) -> tuple:
+        """Return everything the state written to Home Assistant depends on."""
+        return (self._available, self._state, self.coordinator.stale)
+
+    @callback
+    def async_write_ha_state(self) -> None:
+        """Write the state and remember it, so an unchanged one is not written again."""
+        self._written_state = self._state_signature()
+        super().async_write_ha_state()
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        """Handle updated data from the coordinator."""
+        state = self.coordinator.data
+        # properties of a newly enabled entity are missing until the next poll
+        self._available = (
+            self.coordinator.last_update_success
+            and state is not None
+            and self.coordinator_context <= state.data.keys()
+        )
+        if self._available:
             self._state = getattr(state, self._attr, None)
 
-        except DeviceException as ex:
-            if self._available:
-                self._available = False
-                _LOGGER.error("Got exception while fetching the state: %s", ex)
-
+        # polls which change nothing shown by the entity are not written
+        if self._state_signature() != self._written_state:
+            self.async_write_ha_state()
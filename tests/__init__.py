@@ -0,0 +1 @@
+"""Tests of the Xiaomi Smart Humidifier/Dehumidifier component."""
@@ -0,0 +1,160 @@
+"""Fixtures of the Xiaomi Smart Humidifier/Dehumidifier component tests.
+
+The transport is tested against the UDP stand-in of tools/miio_stand_in.py,
+which answers on the loopback network like a dmaker.derh.22ht would. Needs
+python-miio and pytest-homeassistant-custom-component, run from the
+repository root:
+
+    python -m pytest
+"""
+import asyncio
+import os
+import sys
+from typing import Any, Dict, List, Optional, Tuple
+
+import pytest
+import pytest_asyncio
+from miio.protocol import Message
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tools")
+)
+
+# pylint: disable=wrong-import-position
+from custom_components.xiaomi_miio_humidifier.humidifier_miot import (  # noqa: E402
+    MODEL_DMAKER_DERH_22HT,
+    HumidifierMiot,
+)
+from custom_components.xiaomi_miio_humidifier.miio_async import (  # noqa: E402
+    MIIO_PORT,
+    MiioTransport,
+)
+from miio_stand_in import MiioStandInDevice, StandInError, async_serve  # noqa: E402
+
+try:
+    import pytest_socket
+except ImportError:
+    pytest_socket = None
+
+HOST = "127.0.0.1"
+TOKEN = 32 * "0"
+
+
+class HeldStandIn(MiioStandInDevice):
+    """A stand-in which drops, holds back or fails the replies to commands."""
+
+    def __init__(self, **kwargs: Any) -> None:
+        """Initialize the device, it answers right away."""
+        super().__init__(**kwargs)
+        # number of commands to drop before answering again
+        self.drop = 0
+        self.error: Optional[Tuple[int, str]] = None
+        self.errors = 0
+        # siid and piid of the properties whose writes succeed without effect
+        self.ignored = set()
+        self.released = asyncio.Event()
+        self.released.set()
+        self._held = set()
+
+    def datagram_received(self, data: bytes, addr: Tuple[str, int]) -> None:
+        """Answer a handshake at once, and a command once released."""
+        if self.released.is_set():
+            self._answer(data, addr)
+            return
+
+        task = asyncio.get_running_loop().create_task(self._async_answer(data, addr))
+        self._held.add(task)
+        task.add_done_callback(self._held.discard)
+
+    def methods(self) -> List[str]:
+        """Return the methods of the commands received."""
+        return [request["method"] for request in self.requests]
+
+    def handle(self, method: str, params: Any) -> Any:
+        """Fail the next commands with the error, if one is set."""
+        if self.error is not None and self.errors > 0:
+            self.errors -= 1
+            raise StandInError(*self.error)
+
+        return super().handle(method, params)
+
+    def _set_property(self, prop: Dict[str, Any]) -> Dict[str, Any]:
+        """Set a property, unless its writes are ignored."""
+        if (prop["siid"], prop["piid"]) in self.ignored:
+            return {"did": prop.get("did"), "siid": prop["siid"], "piid": prop["piid"], "code": 0}
+
+        return super()._set_property(prop)
+
+    async def _async_answer(self, data: bytes, addr: Tuple[str, int]) -> None:
+        """Answer a datagram once the replies are released."""
+        await self.released.wait()
+        self._answer(data, addr)
+
+    def _answer(self, data: bytes, addr: Tuple[str, int]) -> None:
+        """Answer a datagram, unless it is a command to drop."""
+        if len(data) > 32 and self.drop > 0:
+            self.drop -= 1
+            self.requests.append(Message.parse(data, token=self.token).data.value)
+            return
+
+        super().datagram_received(data, addr)
+
+    def close(self) -> None:
+        """Stop answering the held back datagrams."""
+        for task in list(self._held):
+            task.cancel()
+        self.transport.close()
+
+
+@pytest.fixture(autouse=True)
+def enable_loopback() -> None:
+    """Allow the UDP sockets the transport and the stand-ins bind."""
+    if pytest_socket is not None:
+        pytest_socket.enable_socket()
+
+
+@pytest_asyncio.fixture
+async def serve():
+    """Return a function serving stand-in devices until the test is done."""
+    devices = []
+
+    async def _serve(host: str = "127.0.0.1", port: int = 0, **kwargs: Any) -> HeldStandIn:
+        _, device = await async_serve(host, port, device_class=HeldStandIn, **kwargs)
+        devices.append(device)
+        return device
+
+    yield _serve
+
+    for device in devices:
+        device.close()
+    await asyncio.sleep(0)
+
+
+@pytest_asyncio.fixture
+async def device(serve) -> HeldStandIn:
+    """Serve a dmaker.derh.22ht stand-in where the component looks for it."""
+    return await serve(HOST, MIIO_PORT)
+
+
+@pytest_asyncio.fixture
+async def connect():
+    """Return a function connecting the component to the stand-in as a model."""
+    transport = MiioTransport()
+    humidifiers = []
+
+    def _connect(model: str = MODEL_DMAKER_DERH_22HT) -> HumidifierMiot:
+        humidifier = HumidifierMiot(HOST, TOKEN, model=model, transport=transport)
+        humidifiers.append(humidifier)
+        return humidifier
+
+    yield _connect
+
+    for humidifier in humidifiers:
+        await humidifier.async_close()
+    transport.close()
+
+
+@pytest_asyncio.fixture
+async def humidifier(connect) -> HumidifierMiot:
+    """Return the component side of a dmaker.derh.22ht stand-in."""
+    return connect()
@@ -0,0 +1,114 @@
+"""Tests of the write coalescing."""
+import asyncio
+
+import pytest
+from miio import DeviceException
+
+from custom_components.xiaomi_miio_humidifier.coalescer import WriteCoalescer
+
+pytestmark = pytest.mark.asyncio
+
+WINDOW = 0.05
+
+
+class Sender:
+    """Record the sent requests, the first one waits until released."""
+
+    def __init__(self) -> None:
+        """Initialize the sender, it answers right away."""
+        self.sent = []
+        self.released = asyncio.Event()
+        self.released.set()
+        self.error = None
+
+    async def __call__(self, values):
+        """Send the values of one request."""
+        self.sent.append(dict(values))
+        await self.released.wait()
+        if self.error is not None:
+            raise self.error
+        return {name: {"code": 0, "value": value} for name, value in values.items()}
+
+
+async def test_idle_write_sent_right_away():
+    """A write to an idle device does not wait for the window."""
+    sender = Sender()
+    coalescer = WriteCoalescer(sender, window=10)
+    result = await asyncio.wait_for(coalescer.async_write("target_humidity", 45), 1)
+
+    assert result == {"code": 0, "value": 45}
+    assert sender.sent == [{"target_humidity": 45}]
+    coalescer.cancel()
+
+
+async def test_merge_writes_in_flight():
+    """Writes made while a request is in flight are merged into the next one."""
+    sender = Sender()
+    sender.released.clear()
+    coalescer = WriteCoalescer(sender, window=WINDOW)
+    first = asyncio.ensure_future(coalescer.async_write("status", True))
+    await asyncio.sleep(0.01)
+    assert sender.sent == [{"status": True}]
+
+    later = [
+        asyncio.ensure_future(coalescer.async_write(name, value))
+        for name, value in (("target_humidity", 45), ("target_humidity", 40), ("mode", 1))
+    ]
+    await asyncio.sleep(2 * WINDOW)
+    assert len(sender.sent) == 1
+
+    sender.released.set()
+    results = await asyncio.gather(first, *later)
+    assert sender.sent == [{"status": True}, {"target_humidity": 40, "mode": 1}]
+    # every writer gets the result of the value its write was merged into
+    assert [result["value"] for result in results] == [True, 40, 40, 1]
+
+
+async def test_merge_writes_in_window():
+    """Writes made within the window after a request share the next request."""
+    sender = Sender()
+    coalescer = WriteCoalescer(sender, window=WINDOW)
+    loop = asyncio.get_running_loop()
+    await coalescer.async_write("status", True)
+    start = loop.time()
+    await asyncio.gather(
+        coalescer.async_write("target_humidity", 45),
+        coalescer.async_write("mode", 1),
+    )
+
+    assert sender.sent == [{"status": True}, {"target_humidity": 45, "mode": 1}]
+    assert loop.time() - start >= WINDOW / 2
+
+
+async def test_failure_reaches_merged_writers():
+    """A failed request raises its error in every write merged into it."""
+    sender = Sender()
+    sender.released.clear()
+    sender.error = DeviceException("No response from the device")
+    coalescer = WriteCoalescer(sender, window=WINDOW)
+    writes = [
+        asyncio.ensure_future(coalescer.async_write(name, value))
+        for name, value in (("status", True), ("status", False), ("mode", 1))
+    ]
+    await asyncio.sleep(0)
+    sender.released.set()
+    results = await asyncio.gather(*writes, return_exceptions=True)
+
+    assert sender.sent == [{"status": False, "mode": 1}]
+    assert all(result is sender.error for result in results)
+
+
+async def test_cancel():
+    """Cancelling drops the pending writes and the request in flight."""
+    sender = Sender()
+    sender.released.clear()
+    coalescer = WriteCoalescer(sender, window=WINDOW)
+    first = asyncio.ensure_future(coalescer.async_write("status", True))
+    await asyncio.sleep(0.01)
+    pending = asyncio.ensure_future(coalescer.async_write("mode", 1))
+    await asyncio.sleep(0.01)
+    coalescer.cancel()
+
+    results = await asyncio.gather(first, pending, return_exceptions=True)
+    assert all(isinstance(result, asyncio.CancelledError) for result in results)
+    assert sender.sent == [{"status": True}]
@@ -0,0 +1,103 @@
+"""Tests of the command queue, alone and in front of the stand-in."""
+import asyncio
+
+import pytest
+
+from custom_components.xiaomi_miio_humidifier.command_queue import (
+    PRIORITY_BACKGROUND,
+    PRIORITY_COMMAND,
+    PRIORITY_POLL,
+    CommandQueue,
+)
+
+pytestmark = pytest.mark.asyncio
+
+
+async def _request(queue: CommandQueue, priority: int, name: str, order: list, hold=None):
+    """Take the turn, note it and keep it until released."""
+    async with queue.async_slot(priority):
+        order.append(name)
+        if hold is not None:
+            await hold.wait()
+
+
+async def test_priority_order():
+    """Waiting requests run the most urgent first, in order within a priority."""
+    queue = CommandQueue()
+    order = []
+    hold = asyncio.Event()
+    busy = asyncio.ensure_future(_request(queue, PRIORITY_POLL, "busy", order, hold))
+    await asyncio.sleep(0)
+    waiting = [
+        asyncio.ensure_future(_request(queue, priority, name, order))
+        for priority, name in (
+            (PRIORITY_BACKGROUND, "info"),
+            (PRIORITY_POLL, "poll"),
+            (PRIORITY_COMMAND, "write"),
+            (PRIORITY_COMMAND, "action"),
+        )
+    ]
+    await asyncio.sleep(0)
+    assert order == ["busy"]
+
+    hold.set()
+    await asyncio.gather(busy, *waiting)
+    assert order == ["busy", "write", "action", "poll", "info"]
+
+
+async def test_cancelled_waiter():
+    """A cancelled request gives up its place, the others still run."""
+    queue = CommandQueue()
+    order = []
+    hold = asyncio.Event()
+    busy = asyncio.ensure_future(_request(queue, PRIORITY_POLL, "busy", order, hold))
+    await asyncio.sleep(0)
+    cancelled = asyncio.ensure_future(_request(queue, PRIORITY_COMMAND, "cancelled", order))
+    poll = asyncio.ensure_future(_request(queue, PRIORITY_POLL, "poll", order))
+    await asyncio.sleep(0)
+    cancelled.cancel()
+    hold.set()
+    await asyncio.gather(busy, poll)
+
+    assert cancelled.cancelled()
+    assert order == ["busy", "poll"]
+    # the queue is free again
+    await asyncio.wait_for(_request(queue, PRIORITY_BACKGROUND, "info", order), 1)
+
+
+async def test_cancelled_after_handover():
+    """A request cancelled when its turn came passes the turn on."""
+    queue = CommandQueue()
+    order = []
+    hold = asyncio.Event()
+    busy = asyncio.ensure_future(_request(queue, PRIORITY_POLL, "busy", order, hold))
+    await asyncio.sleep(0)
+    cancelled = asyncio.ensure_future(_request(queue, PRIORITY_COMMAND, "cancelled", order))
+    poll = asyncio.ensure_future(_request(queue, PRIORITY_POLL, "poll", order))
+    await asyncio.sleep(0)
+    hold.set()
+    # the turn is handed to the waiter before it gets to run
+    await asyncio.sleep(0)
+    cancelled.cancel()
+    await asyncio.gather(busy, poll)
+
+    assert cancelled.cancelled()
+    assert order == ["busy", "poll"]
+
+
+async def test_commands_before_polls(device, humidifier):
+    """Writes and actions go before waiting polls, and polls before the info."""
+    device.released.clear()
+    busy = asyncio.ensure_future(humidifier.async_action({"siid": 2, "aiid": 1}))
+    await asyncio.sleep(0.05)
+    waiting = [
+        asyncio.ensure_future(humidifier.async_info()),
+        asyncio.ensure_future(humidifier.async_status({"temperature"})),
+        asyncio.ensure_future(humidifier.async_set_property("target_humidity", 45)),
+    ]
+    await asyncio.sleep(0.05)
+    device.released.set()
+    await asyncio.gather(busy, *waiting)
+
+    assert device.methods() == ["action", "set_properties", "get_properties", "miIO.info"]
+    assert device.properties[(2, 5)] == 45
@@ -0,0 +1,63 @@
+"""Tests of the status coordinator against the stand-in."""
+from unittest.mock import patch
+
+import pytest
+from homeassistant.components.humidifier import ATTR_HUMIDITY, DOMAIN as HUMIDIFIER_DOMAIN
+from homeassistant.const import ATTR_ENTITY_ID
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+
+from custom_components.xiaomi_miio_humidifier.const import DOMAIN, MODEL_DMAKER_DERH_22HT
+
+from .conftest import HOST, TOKEN
+
+pytestmark = pytest.mark.asyncio
+
+
+@pytest.fixture(autouse=True)
+def auto_enable_custom_integrations(enable_custom_integrations):
+    """Load the component from custom_components."""
+    yield
+
+
+async def test_write_rolled_back(hass, device):
+    """A write the device does not apply is shown until it is read back."""
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        title="Dehumidifier",
+        unique_id="02:00:00:00:00:01",
+        data={
+            "config_flow_device": "device",
+            "host": HOST,
+            "token": TOKEN,
+            "model": MODEL_DMAKER_DERH_22HT,
+        },
+    )
+    entry.add_to_hass(hass)
+    assert await hass.config_entries.async_setup(entry.entry_id)
+    await hass.async_block_till_done()
+    entity_id = hass.states.async_entity_ids(HUMIDIFIER_DOMAIN)[0]
+    coordinator = hass.data[DOMAIN][HOST]["coordinator"]
+    assert hass.states.get(entity_id).attributes[ATTR_HUMIDITY] == 50
+
+    device.ignored.add((2, 5))
+    with patch("custom_components.xiaomi_miio_humidifier.coordinator.VERIFY_DELAY", 0):
+        await hass.services.async_call(
+            HUMIDIFIER_DOMAIN,
+            "set_humidity",
+            {ATTR_ENTITY_ID: entity_id, ATTR_HUMIDITY: 45},
+            blocking=True,
+        )
+        # shown before the device is asked again
+        assert hass.states.get(entity_id).attributes[ATTR_HUMIDITY] == 45
+        written = len(device.requests)
+        await coordinator._verify_task  # pylint: disable=protected-access
+        await hass.async_block_till_done()
+
+    assert hass.states.get(entity_id).attributes[ATTR_HUMIDITY] == 50
+    # only the written property was read back
+    read_back = device.requests[written:]
+    assert [request["method"] for request in read_back] == ["get_properties"]
+    assert [prop["did"] for prop in read_back[0]["params"]] == ["target_humidity"]
+
+    assert await hass.config_entries.async_unload(entry.entry_id)
+    await hass.async_block_till_done()
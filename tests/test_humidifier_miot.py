@@ -0,0 +1,60 @@
+"""Tests of the status polls of a device against the stand-in."""
+import asyncio
+
+import pytest
+from miio.exceptions import DeviceError
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_status(device, humidifier):
+    """A poll returns the values of the device."""
+    status = await humidifier.async_status()
+
+    assert status.target_humidity == 50
+    assert status.temperature == 25
+    assert device.methods() == ["get_properties"]
+
+
+async def test_poll_joined(device, humidifier):
+    """A poll made while another one is in flight gets its result."""
+    device.released.clear()
+    first = asyncio.ensure_future(humidifier.async_status())
+    await asyncio.sleep(0.05)
+    joined = asyncio.ensure_future(humidifier.async_status({"temperature"}))
+    await asyncio.sleep(0.05)
+    device.released.set()
+
+    assert await first is await joined
+    assert device.methods() == ["get_properties"]
+
+
+async def test_cancelled_poll_handed_over(device, humidifier):
+    """A poll whose caller is cancelled is sent by a caller which joined it."""
+    device.released.clear()
+    owner = asyncio.ensure_future(humidifier.async_status())
+    await asyncio.sleep(0.05)
+    joined = [asyncio.ensure_future(humidifier.async_status()) for _ in range(2)]
+    await asyncio.sleep(0.05)
+    owner.cancel()
+    await asyncio.sleep(0.05)
+    device.released.set()
+    first, second = await asyncio.gather(*joined)
+
+    assert owner.cancelled()
+    assert first is second
+    assert first.target_humidity == 50
+
+
+async def test_failed_poll_shared(device, humidifier):
+    """A failed poll raises its error in the polls which joined it."""
+    device.released.clear()
+    device.error = (-5001, "invalid request")
+    device.errors = 1
+    polls = [asyncio.ensure_future(humidifier.async_status()) for _ in range(2)]
+    await asyncio.sleep(0.05)
+    device.released.set()
+    results = await asyncio.gather(*polls, return_exceptions=True)
+
+    assert all(isinstance(result, DeviceError) for result in results)
+    assert device.methods() == ["get_properties"]
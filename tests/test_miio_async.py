@@ -0,0 +1,173 @@
+"""Tests of the asyncio miIO transport against the stand-in device."""
+import asyncio
+
+import pytest
+from miio import DeviceException
+from miio.exceptions import DeviceError
+
+from custom_components.xiaomi_miio_humidifier.miio_async import (
+    AsyncMiioProtocol,
+    MiioTransport,
+)
+
+from .conftest import TOKEN
+
+pytestmark = pytest.mark.asyncio
+
+TEMPERATURE = [{"did": "temperature", "siid": 3, "piid": 2}]
+
+
+def _protocol(device, transport=None, **kwargs) -> AsyncMiioProtocol:
+    """Return a protocol talking to a stand-in device."""
+    host, port = device.transport.get_extra_info("sockname")[:2]
+    return AsyncMiioProtocol(host, TOKEN, port=port, transport=transport, **kwargs)
+
+
+async def test_handshake(serve):
+    """The first command does a handshake and keeps the device id."""
+    device = await serve(device_id=0x01020304)
+    protocol = _protocol(device)
+    try:
+        result = await protocol.async_send("get_properties", TEMPERATURE)
+        await protocol.async_send("get_properties", TEMPERATURE)
+    finally:
+        await protocol.async_close()
+
+    assert result == [{**TEMPERATURE[0], "code": 0, "value": 25}]
+    assert device.handshakes == 1
+    assert protocol.device_id == bytes.fromhex("01020304")
+    assert [request["id"] for request in device.requests] == [1, 2]
+
+
+async def test_retry_after_dropped_reply(serve):
+    """A command without reply is sent again after a new handshake."""
+    device = await serve()
+    device.drop = 1
+    protocol = _protocol(device, timeout=0.1)
+    try:
+        result = await protocol.async_send("get_properties", TEMPERATURE)
+    finally:
+        await protocol.async_close()
+
+    assert result[0]["value"] == 25
+    assert device.handshakes == 2
+    # the retry skips 100 ids, like miio does
+    assert [request["id"] for request in device.requests] == [1, 102]
+
+
+async def test_no_reply(serve):
+    """A device which never answers fails once the retries are used up."""
+    device = await serve()
+    device.drop = 3
+    protocol = _protocol(device, timeout=0.05)
+    try:
+        with pytest.raises(DeviceException, match="No response"):
+            await protocol.async_send("get_properties", TEMPERATURE, retry_count=2)
+    finally:
+        await protocol.async_close()
+
+    assert len(device.requests) == 3
+
+
+async def test_retry_recoverable_error(serve):
+    """A recoverable error is retried, other errors are raised."""
+    device = await serve()
+    device.error = (-30001, "busy")
+    device.errors = 1
+    protocol = _protocol(device)
+    try:
+        result = await protocol.async_send("get_properties", TEMPERATURE)
+        device.error = (-5001, "invalid")
+        device.errors = 1
+        with pytest.raises(DeviceError):
+            await protocol.async_send("get_properties", TEMPERATURE)
+    finally:
+        await protocol.async_close()
+
+    assert result[0]["value"] == 25
+    assert len(device.requests) == 3
+
+
+async def test_restore_session(serve):
+    """A restored session skips the handshake and continues the message ids."""
+    device = await serve()
+    protocol = _protocol(device)
+    assert protocol.session() is None
+    try:
+        await protocol.async_send("get_properties", TEMPERATURE)
+        session = protocol.session()
+    finally:
+        await protocol.async_close()
+
+    restored = _protocol(device)
+    restored.restore_session(session)
+    try:
+        await restored.async_send("get_properties", TEMPERATURE)
+    finally:
+        await restored.async_close()
+
+    assert device.handshakes == 1
+    assert device.requests[-1]["id"] == session["id"] + 1
+
+
+async def test_shared_socket_routing(serve):
+    """Replies on a shared socket reach their device, by id and by address."""
+    first = await serve(device_id=0x11111111)
+    second = await serve(device_id=0x22222222)
+    # a factory reset device may share its id with another one
+    twin = await serve(device_id=0x22222222)
+    first.properties[(3, 2)] = 21
+    second.properties[(3, 2)] = 22
+    twin.properties[(3, 2)] = 23
+    transport = MiioTransport()
+    protocols = [_protocol(device, transport) for device in (first, second, twin)]
+    try:
+        results = await asyncio.gather(*(
+            protocol.async_send("get_properties", TEMPERATURE) for protocol in protocols
+        ))
+        sockets = {id(protocol._transport) for protocol in protocols}
+    finally:
+        for protocol in protocols:
+            await protocol.async_close()
+        transport.close()
+
+    assert [result[0]["value"] for result in results] == [21, 22, 23]
+    assert [protocol.device_id.hex() for protocol in protocols] == [
+        "11111111", "22222222", "22222222"
+    ]
+    assert sockets == {id(transport)}
+
+
+async def test_close_fails_pending(serve):
+    """Closing the socket fails the requests waiting for a reply."""
+    device = await serve()
+    transport = MiioTransport()
+    protocol = _protocol(device, transport)
+    try:
+        await protocol.async_send("get_properties", TEMPERATURE)
+        device.released.clear()
+        request = asyncio.ensure_future(protocol.async_send("get_properties", TEMPERATURE))
+        await asyncio.sleep(0.05)
+        transport.close()
+        with pytest.raises(DeviceException, match="closed"):
+            await request
+    finally:
+        await protocol.async_close()
+
+    assert transport.transport is None
+
+
+async def test_closed_protocol(serve):
+    """A closed protocol fails its pending and further requests."""
+    device = await serve()
+    protocol = _protocol(device)
+    await protocol.async_send("get_properties", TEMPERATURE)
+    device.released.clear()
+    request = asyncio.ensure_future(protocol.async_send("get_properties", TEMPERATURE))
+    await asyncio.sleep(0.05)
+    await protocol.async_close()
+
+    with pytest.raises(DeviceException, match="closed"):
+        await request
+    with pytest.raises(DeviceException, match="closed"):
+        await protocol.async_send("get_properties", TEMPERATURE)
@@ -0,0 +1,85 @@
+"""Tests of the capability probe and pruning against the stand-in."""
+import pytest
+from miio_stand_in import DEFAULT_PROPERTIES
+
+from custom_components.xiaomi_miio_humidifier.const import (
+    MODEL_DMAKER_DERH_22HT,
+    MODEL_DMAKER_DERH_50L,
+    MODEL_XIAOMI_DERH_LITE,
+)
+from custom_components.xiaomi_miio_humidifier.humidifier_miot import MAX_PROPERTY_FAILURES
+from custom_components.xiaomi_miio_humidifier.miio_async import MIIO_PORT
+
+from .conftest import HOST
+
+pytestmark = pytest.mark.asyncio
+
+# the dehumidifier service of the xiaomi.derh.lite, without off delay
+LITE_PROPERTIES = {
+    **{key: value for key, value in DEFAULT_PROPERTIES.items() if key[0] != 7},
+    (7, 1): True,   # dry_after_off
+    (7, 2): 120,    # dry_left_time
+    (7, 3): False,  # is_warming_up
+}
+
+
+def _polled(request) -> set:
+    """Return the siid and piid of the properties a request asked for."""
+    return {(prop["siid"], prop["piid"]) for prop in request["params"]}
+
+
+async def test_probe_missing_properties(serve, connect):
+    """An unknown model lacking some properties gets the closest mapping without them."""
+    properties = dict(DEFAULT_PROPERTIES)
+    del properties[(4, 1)]
+    del properties[(6, 1)]
+    device = await serve(HOST, MIIO_PORT, properties=properties)
+    humidifier = connect(MODEL_DMAKER_DERH_50L)
+
+    layout, unsupported = await humidifier.async_probe()
+
+    assert layout == MODEL_DMAKER_DERH_22HT
+    assert sorted(unsupported) == ["alarm", "physical_controls_locked"]
+    assert humidifier.layout == layout
+    assert humidifier.unsupported == set(unsupported)
+    # the values of the probe are the first poll
+    assert humidifier.known_status().target_humidity == 50
+    await humidifier.async_status()
+    assert not _polled(device.requests[-1]) & {(4, 1), (6, 1)}
+
+
+async def test_probe_lite(serve, connect):
+    """An unknown model with the layout of the Lite gets its mapping."""
+    device = await serve(HOST, MIIO_PORT, properties=LITE_PROPERTIES)
+    humidifier = connect(MODEL_DMAKER_DERH_50L)
+
+    assert await humidifier.async_probe() == (MODEL_XIAOMI_DERH_LITE, [])
+    assert humidifier.known_status().dry_left_time == 120
+    # the probe stops at the mapping which fits
+    assert len(device.requests) == 3
+
+
+async def test_probe_cached_layout(serve, connect):
+    """A known mapping is probed alone."""
+    device = await serve(HOST, MIIO_PORT, properties=LITE_PROPERTIES)
+    humidifier = connect(MODEL_DMAKER_DERH_50L)
+
+    assert await humidifier.async_probe([MODEL_XIAOMI_DERH_LITE]) == (MODEL_XIAOMI_DERH_LITE, [])
+    assert len(device.requests) == 1
+
+
+async def test_prune_rejected_property(serve, connect):
+    """A property rejected on every poll is no longer polled."""
+    properties = dict(DEFAULT_PROPERTIES)
+    del properties[(7, 4)]
+    device = await serve(HOST, MIIO_PORT, properties=properties)
+    humidifier = connect()
+
+    for _ in range(MAX_PROPERTY_FAILURES):
+        await humidifier.async_status()
+        assert (7, 4) in _polled(device.requests[-1])
+
+    assert humidifier.unsupported == {"is_warming_up"}
+    status = await humidifier.async_status()
+    assert (7, 4) not in _polled(device.requests[-1])
+    assert status.is_warming_up is None
@@ -0,0 +1,68 @@
+"""Tests of the adaptive poll scheduler."""
+from custom_components.xiaomi_miio_humidifier.humidifier_miot import PowerMode_V1
+from custom_components.xiaomi_miio_humidifier.scheduler import AdaptivePollScheduler
+
+
+def _scheduler() -> AdaptivePollScheduler:
+    """Return a scheduler polling every 60 seconds, between 10 and 600."""
+    return AdaptivePollScheduler(60, 10, 600)
+
+
+def test_idle_backoff():
+    """Idle devices back off up to the maximum interval, faster while off."""
+    scheduler = _scheduler()
+    off = {"status": False, "temperature": 25}
+    intervals = [scheduler.next_interval(off) for _ in range(4)]
+    # the readings of the room do not count
+    intervals.append(scheduler.next_interval({**off, "temperature": 26}))
+    assert intervals == [120, 240, 480, 600, 600]
+
+    scheduler = _scheduler()
+    assert scheduler.next_interval({"status": True}) == 90
+
+
+def test_active_device():
+    """Devices drying or warming up are polled at the minimum interval."""
+    scheduler = _scheduler()
+    assert scheduler.next_interval({"status": False, "dry_left_time": 5}) == 10
+    assert scheduler.next_interval({"status": True, "is_warming_up": True}) == 10
+    assert scheduler.next_interval(
+        {"status": True, "mode": PowerMode_V1.Clothes_Drying.value}
+    ) == 10
+
+
+def test_changing_device():
+    """Devices whose settings change are polled faster the more they change."""
+    scheduler = _scheduler()
+    scheduler.next_interval({"status": True, "target_humidity": 50})
+    assert scheduler.next_interval({"status": True, "target_humidity": 45}) == 30
+
+
+def test_jittering_readings():
+    """A device on at its target backs off, however its readings jitter."""
+    scheduler = _scheduler()
+    intervals = [
+        scheduler.next_interval({
+            "status": True,
+            "target_humidity": 50,
+            "relative_humidity": 50 + poll % 2,
+            "temperature": 25 - poll % 2,
+        })
+        for poll in range(4)
+    ]
+    assert intervals == [90, 135, 202.5, 303.75]
+
+
+def test_command_and_failure():
+    """A command polls at the minimum interval for a while, a failure at the scan interval."""
+    scheduler = _scheduler()
+    assert scheduler.note_command() == 10
+    assert scheduler.next_interval({"status": False}) == 10
+    assert scheduler.note_failure() == 60
+
+
+def test_bounds():
+    """The scan interval is kept within the bounds, which are sorted."""
+    scheduler = AdaptivePollScheduler(5, 100, 20)
+    assert (scheduler.min_interval, scheduler.max_interval) == (20, 100)
+    assert scheduler.scan_interval == scheduler.interval == 20
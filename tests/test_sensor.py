@@ -0,0 +1,117 @@
+"""Tests of the publish filter of the sensors."""
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+from homeassistant.helpers.entity import Entity
+
+from custom_components.xiaomi_miio_humidifier.const import (
+    CONF_DEADBAND,
+    CONF_DEADBAND_PERCENT,
+    CONF_MIN_PUBLISH_INTERVAL,
+    CONF_PUBLISH_HEARTBEAT,
+    HUMIDIFIER_SENSORS,
+)
+from custom_components.xiaomi_miio_humidifier.humidifier_miot import (
+    MODEL_DMAKER_DERH_22HT,
+    HumidifierStatusMiot,
+)
+from custom_components.xiaomi_miio_humidifier.sensor import XiaomiHumidifierSensor
+
+from .conftest import HOST, TOKEN
+
+
+class Sensor:
+    """A sensor on a fake coordinator, with a clock set by the test."""
+
+    def __init__(self, key: str, **options) -> None:
+        """Initialize the sensor of a property without data."""
+        self.now = 0.0
+        self.writes = []
+        self.coordinator = SimpleNamespace(data=None, last_update_success=True, stale=False)
+        description = next(sensor for sensor in HUMIDIFIER_SENSORS if sensor.key == key)
+        entry_data = {"model": MODEL_DMAKER_DERH_22HT, "host": HOST, "token": TOKEN, **options}
+        self.entity = XiaomiHumidifierSensor(
+            self.coordinator, entry_data, description, "Test", "test", None
+        )
+        self.key = key
+
+    def poll(self, at: float, value=None, **coordinator) -> bool:
+        """Update the sensor with a polled value, return whether it was written."""
+        self.now = at
+        data = {} if value is None else {self.key: value}
+        self.coordinator.data = HumidifierStatusMiot.from_values(data, at)
+        self.coordinator.__dict__.update(coordinator)
+        written = len(self.writes)
+        with patch(
+            "custom_components.xiaomi_miio_humidifier.sensor.monotonic", lambda: self.now
+        ), patch.object(Entity, "async_write_ha_state", lambda _: self.writes.append(at)):
+            self.entity._handle_coordinator_update()  # pylint: disable=protected-access
+
+        return len(self.writes) > written
+
+
+def test_unfiltered_sensor():
+    """A sensor without filter writes every change and only changes."""
+    sensor = Sensor("dry_left_time", **{CONF_MIN_PUBLISH_INTERVAL: 60})
+    assert sensor.poll(0, 10)
+    assert not sensor.poll(1, 10)
+    assert sensor.poll(2, 9)
+    assert sensor.entity.native_value == 9
+
+
+@pytest.mark.parametrize(
+    ("options", "held", "written"),
+    [
+        ({CONF_DEADBAND.format("temperature"): 1}, 26, 27),
+        ({CONF_DEADBAND_PERCENT.format("temperature"): 10}, 27, 28),
+    ],
+)
+def test_deadband(options, held, written):
+    """Changes within the deadband of the last written value are held back."""
+    sensor = Sensor("temperature", **options)
+    assert sensor.poll(0, 25)
+    assert not sensor.poll(1, held)
+    assert not sensor.poll(2, 25)
+    assert sensor.poll(3, written)
+    assert sensor.entity.native_value == written
+
+
+def test_min_publish_interval():
+    """Changes are held back until the minimum interval passed."""
+    sensor = Sensor("relative_humidity", **{CONF_MIN_PUBLISH_INTERVAL: 60})
+    assert sensor.poll(0, 60)
+    assert not sensor.poll(30, 58)
+    assert sensor.poll(60, 57)
+    assert sensor.writes == [0, 60]
+
+
+def test_heartbeat():
+    """The state is written again after the heartbeat, held back or unchanged."""
+    sensor = Sensor("temperature", **{
+        CONF_DEADBAND.format("temperature"): 2,
+        CONF_PUBLISH_HEARTBEAT: 300,
+    })
+    assert sensor.poll(0, 25)
+    assert not sensor.poll(100, 26)
+    # the held back value is written with the heartbeat
+    assert sensor.poll(300, 26)
+    assert not sensor.poll(400, 26)
+    assert sensor.poll(600, 26)
+    assert sensor.writes == [0, 300, 600]
+
+
+def test_availability_and_stale_not_held_back():
+    """Losing the property or the device and going stale are written at once."""
+    sensor = Sensor("temperature", **{
+        CONF_DEADBAND.format("temperature"): 5,
+        CONF_MIN_PUBLISH_INTERVAL: 60,
+    })
+    assert sensor.poll(0, 25)
+    assert sensor.poll(1, 25, stale=True)
+    assert sensor.poll(2, 25, stale=False)
+    assert sensor.poll(3)
+    assert not sensor.entity.available
+    assert sensor.poll(4, 25)
+    assert sensor.poll(5, 25, last_update_success=False)
+    assert sensor.writes == [0, 1, 2, 3, 4, 5]
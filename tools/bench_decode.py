@@ -0,0 +1,183 @@
+"""Micro-benchmarks of the status decoding hot path.
+
+Runs every case against the recorded get_properties responses of each model
+(tools/recorded_payloads.json), without network or event loop:
+
+- decode: merge a response into the last known values and build the status,
+  as HumidifierMiot.async_status does after a poll
+- property:<name>: one read of a HumidifierStatusMiot property
+- sensors, switches: the coordinator update of all sensor or switch
+  entities of a device, writing the state is left out
+
+The time per call is the best of several runs. Saving the results with
+--json and passing them to a later run with --compare fails the run when a
+case got slower than the tolerance, so the baseline guards against
+regressions. Needs Home Assistant for the entity cases:
+
+    python tools/bench_decode.py --json baseline.json
+    python tools/bench_decode.py --compare baseline.json --tolerance 0.2
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+from time import monotonic
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# pylint: disable=wrong-import-position
+from custom_components.xiaomi_miio_humidifier.const import (  # noqa: E402
+    HUMIDIFIER_SENSORS,
+    HUMIDIFIER_SWITCHS_V1
+)
+from custom_components.xiaomi_miio_humidifier.humidifier_miot import (  # noqa: E402
+    HumidifierMiot,
+    HumidifierStatusMiot
+)
+from custom_components.xiaomi_miio_humidifier.sensor import XiaomiHumidifierSensor  # noqa: E402
+from custom_components.xiaomi_miio_humidifier.switch import XiaomiHumidifierSwitch  # noqa: E402
+
+PAYLOADS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "recorded_payloads.json")
+# properties read by the entities during an update
+STATUS_PROPERTIES = (
+    "is_on",
+    "status",
+    "mode",
+    "system_status",
+    "temperature",
+    "relative_humidity",
+    "target_humidity",
+    "indicator_light",
+    "alarm",
+    "dry_after_off",
+    "physical_controls_locked",
+    "dry_left_time",
+    "is_warming_up",
+)
+REPEAT = 5
+DEFAULT_TOLERANCE = 0.2
+
+
+def _decode_case(model: str, response: List[Dict[str, Any]]) -> Callable[[], Any]:
+    """Return a call decoding a full response."""
+    device = HumidifierMiot("127.0.0.1", 32 * "0", model=model)
+
+    def decode() -> HumidifierStatusMiot:
+        now = monotonic()
+        device._status_request(now, None)  # pylint: disable=protected-access
+        device._status_update(now, response)  # pylint: disable=protected-access
+        device._fetched_at.clear()  # pylint: disable=protected-access
+        values = dict(device._values)  # pylint: disable=protected-access
+        return HumidifierStatusMiot.from_values(values, now)
+
+    return decode
+
+
+def _property_case(status: HumidifierStatusMiot, name: str) -> Callable[[], Any]:
+    """Return a call reading one status property."""
+    return lambda: getattr(status, name)
+
+
+def _entity_case(entity_class, descriptions, model: str,
+                 status: HumidifierStatusMiot) -> Callable[[], None]:
+    """Return a call updating all entities of a platform from the coordinator."""
+    coordinator = SimpleNamespace(data=status, last_update_success=True, stale=False)
+    entry_data = {"model": model, "host": "127.0.0.1", "token": 32 * "0"}
+    entities = []
+    for description in descriptions:
+        entity = entity_class(coordinator, entry_data, description, "Bench", "bench", None)
+        entity.async_write_ha_state = lambda: None
+        entities.append(entity)
+
+    def update() -> None:
+        for entity in entities:
+            entity._handle_coordinator_update()  # pylint: disable=protected-access
+
+    return update
+
+
+def cases(model: str, response: List[Dict[str, Any]]) -> Dict[str, Callable[[], Any]]:
+    """Return the benchmark cases of one model."""
+    decode = _decode_case(model, response)
+    status = decode()
+    return {
+        "decode": decode,
+        **{f"property:{name}": _property_case(status, name) for name in STATUS_PROPERTIES},
+        "sensors": _entity_case(XiaomiHumidifierSensor, HUMIDIFIER_SENSORS, model, status),
+        "switches": _entity_case(XiaomiHumidifierSwitch, HUMIDIFIER_SWITCHS_V1, model, status),
+    }
+
+
+def measure(func: Callable[[], Any]) -> float:
+    """Return the best time of one call in nanoseconds."""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=REPEAT, number=number)) / number * 1e9
+
+
+def run(payloads: Dict[str, Any]) -> Dict[str, Dict[str, float]]:
+    """Run all cases of all models."""
+    return {
+        model: {name: round(measure(func), 1)
+                for name, func in cases(model, response["result"]).items()}
+        for model, response in payloads.items()
+    }
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+            tolerance: float) -> List[str]:
+    """Return the cases slower than the baseline by more than the tolerance."""
+    regressions = []
+    for model, values in results.items():
+        for name, value in values.items():
+            before = baseline.get(model, {}).get(name)
+            if before and value > before * (1 + tolerance):
+                regressions.append(f"{model} {name}: {before:.1f} -> {value:.1f} ns")
+
+    return regressions
+
+
+def _print(results: Dict[str, Dict[str, float]]) -> None:
+    """Print the results as a table."""
+    print(f"{'model':<18} {'case':<34} {'ns/call':>10}")
+    for model, values in results.items():
+        for name, value in values.items():
+            print(f"{model:<18} {name:<34} {value:>10.1f}")
+
+
+def _main(args: argparse.Namespace) -> int:
+    with open(args.payloads, encoding="utf-8") as file:
+        payloads = json.load(file)
+    if args.model:
+        payloads = {model: payloads[model] for model in args.model}
+
+    results = run(payloads)
+    _print(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for regression in regressions:
+            print(f"Slower than the baseline: {regression}")
+        return 1 if regressions else 0
+
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--payloads", default=PAYLOADS,
+                        help="recorded get_properties responses by model")
+    parser.add_argument("--model", action="append", help="only benchmark these models")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--compare", help="results of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="allowed slow down against the baseline, 0.2 is 20%%")
+    sys.exit(_main(parser.parse_args()))
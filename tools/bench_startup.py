@@ -0,0 +1,256 @@
+"""Startup, reload and unload benchmark of the integration.
+
+Sets up 1, 10, 100 and 500 config entries against local stand-in devices
+(tools/miio_stand_in.py) and times each phase:
+
+- setup: async_setup_entry of all entries through async_forward_entry_setups
+- first poll: until every coordinator holds polled, not restored, data
+- live options: a scan interval change, applied without a reload
+- reload: an option change which reloads every entry
+- unload: async_unload_entry of all entries
+
+For each phase the wall time, the time the event loop was blocked and the
+occupancy of the executor are reported. The stand-ins answer from the same
+event loop, so the first poll includes their work. Needs Home Assistant and
+pytest-homeassistant-custom-component, and binds the stand-ins to
+127.0.x.y:54321, which Linux allows for the whole loopback network:
+
+    python tools/bench_startup.py --entries 1 10 100 --json bench.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# the integration must be imported before the test helpers add theirs
+import custom_components.xiaomi_miio_humidifier  # noqa: E402  pylint: disable=wrong-import-position
+from homeassistant import loader  # noqa: E402
+from homeassistant.setup import async_setup_component  # noqa: E402
+from pytest_homeassistant_custom_component.common import (  # noqa: E402
+    MockConfigEntry,
+    async_test_home_assistant
+)
+
+from miio_stand_in import async_serve  # noqa: E402
+
+DOMAIN = "xiaomi_miio_humidifier"
+MODEL = "dmaker.derh.22ht"
+DEFAULT_ENTRIES = (1, 10, 100, 500)
+# resolution of the event loop stall measurement
+LOOP_TICK = 0.005
+FIRST_POLL_TIMEOUT = 60
+
+
+class LoopMonitor:
+    """Measure how long the event loop did not run a periodic task."""
+
+    def __init__(self) -> None:
+        self.blocked = 0.0
+        self.max_stall = 0.0
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(LOOP_TICK)
+            stall = time.perf_counter() - started - LOOP_TICK
+            if stall > LOOP_TICK:
+                self.blocked += stall
+                self.max_stall = max(self.max_stall, stall)
+
+    def start(self) -> None:
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self) -> None:
+        self._task.cancel()
+
+
+class ExecutorMonitor:
+    """Measure how long jobs ran in the default executor."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop) -> None:
+        self.busy = 0.0
+        self.jobs = 0
+        self._loop = loop
+        self._run_in_executor = loop.run_in_executor
+
+    def _timed(self, func):
+        def run(*args):
+            started = time.perf_counter()
+            try:
+                return func(*args)
+            finally:
+                self.busy += time.perf_counter() - started
+                self.jobs += 1
+
+        return run
+
+    def start(self) -> None:
+        def run_in_executor(executor, func, *args):
+            return self._run_in_executor(executor, self._timed(func), *args)
+
+        self._loop.run_in_executor = run_in_executor
+
+    def stop(self) -> None:
+        self._loop.run_in_executor = self._run_in_executor
+
+    @property
+    def workers(self) -> int:
+        executor = getattr(self._loop, "_default_executor", None)
+        return getattr(executor, "_max_workers", 0) or 1
+
+
+@contextmanager
+def measure(results: Dict[str, Any], phase: str, loop_monitor: LoopMonitor,
+            executor_monitor: ExecutorMonitor) -> Iterator[None]:
+    """Record the wall time, loop blocking and executor busy time of a phase."""
+    blocked, max_stall = loop_monitor.blocked, loop_monitor.max_stall
+    busy, jobs = executor_monitor.busy, executor_monitor.jobs
+    loop_monitor.max_stall = 0.0
+    started = time.perf_counter()
+    yield
+    wall = time.perf_counter() - started
+    busy = executor_monitor.busy - busy
+    results[phase] = {
+        "wall_s": round(wall, 4),
+        "loop_blocked_s": round(loop_monitor.blocked - blocked, 4),
+        "max_stall_s": round(loop_monitor.max_stall, 4),
+        "executor_jobs": executor_monitor.jobs - jobs,
+        "executor_busy_s": round(busy, 4),
+        "executor_occupancy": round(busy / (wall * executor_monitor.workers), 4) if wall else 0,
+    }
+    loop_monitor.max_stall = max(loop_monitor.max_stall, max_stall)
+
+
+def _host(index: int) -> str:
+    """Return the loopback address of a stand-in."""
+    return f"127.0.{index // 250}.{index % 250 + 1}"
+
+
+def _token(index: int) -> str:
+    """Return the token of a stand-in, the entities use it as device connection."""
+    return f"{index + 1:032x}"
+
+
+async def _wait_first_poll(hass, hosts: List[str]) -> None:
+    """Wait until every coordinator polled its device."""
+    deadline = time.monotonic() + FIRST_POLL_TIMEOUT
+    while time.monotonic() < deadline:
+        coordinators = [
+            hass.data.get(DOMAIN, {}).get(host, {}).get("coordinator") for host in hosts
+        ]
+        if all(
+            coordinator is not None and coordinator.data is not None and not coordinator.stale
+            for coordinator in coordinators
+        ):
+            return
+        await asyncio.sleep(LOOP_TICK)
+
+    raise TimeoutError("The first poll did not finish in time")
+
+
+async def bench(entries: int) -> Dict[str, Any]:
+    """Run all phases for a number of entries."""
+    results: Dict[str, Any] = {"entries": entries}
+    hosts = [_host(index) for index in range(entries)]
+    servers = [
+        await async_serve(host, 54321, token=_token(index), model=MODEL, device_id=index + 1)
+        for index, host in enumerate(hosts)
+    ]
+
+    with tempfile.TemporaryDirectory() as storage_dir:
+        async with async_test_home_assistant(storage_dir=storage_dir) as hass:
+            hass.data.pop(loader.DATA_CUSTOM_COMPONENTS, None)
+            config_entries = []
+            for index, host in enumerate(hosts):
+                entry = MockConfigEntry(
+                    domain=DOMAIN,
+                    title=f"Dehumidifier {index}",
+                    unique_id=f"bench-{index}",
+                    data={"config_flow_device": "device", "host": host,
+                          "token": _token(index), "model": MODEL},
+                )
+                entry.add_to_hass(hass)
+                config_entries.append(entry)
+
+            loop_monitor = LoopMonitor()
+            executor_monitor = ExecutorMonitor(hass.loop)
+            loop_monitor.start()
+            executor_monitor.start()
+            try:
+                with measure(results, "setup", loop_monitor, executor_monitor):
+                    assert await async_setup_component(hass, DOMAIN, {})
+                    await hass.async_block_till_done()
+
+                with measure(results, "first_poll", loop_monitor, executor_monitor):
+                    await _wait_first_poll(hass, hosts)
+
+                with measure(results, "live_options", loop_monitor, executor_monitor):
+                    for entry in config_entries:
+                        hass.config_entries.async_update_entry(
+                            entry, options={**entry.options, "scan_interval": 60}
+                        )
+                    await hass.async_block_till_done()
+
+                with measure(results, "reload", loop_monitor, executor_monitor):
+                    for entry in config_entries:
+                        hass.config_entries.async_update_entry(
+                            entry, options={**entry.options, "bench_reload": True}
+                        )
+                    await hass.async_block_till_done()
+
+                with measure(results, "unload", loop_monitor, executor_monitor):
+                    await asyncio.gather(*(
+                        hass.config_entries.async_unload(entry.entry_id)
+                        for entry in config_entries
+                    ))
+                    await hass.async_block_till_done()
+            finally:
+                executor_monitor.stop()
+                loop_monitor.stop()
+                await hass.async_stop(force=True)
+
+    for transport, _ in servers:
+        transport.close()
+    # the sockets are closed on the next iteration of the loop
+    await asyncio.sleep(0)
+
+    return results
+
+
+def _print(results: List[Dict[str, Any]]) -> None:
+    """Print the results as a table."""
+    print(f"{'entries':>8} {'phase':<13} {'wall s':>9} {'blocked s':>10} "
+          f"{'max stall s':>12} {'exec jobs':>10} {'exec busy s':>12} {'occupancy':>10}")
+    for result in results:
+        for phase, values in result.items():
+            if phase == "entries":
+                continue
+            print(f"{result['entries']:>8} {phase:<13} {values['wall_s']:>9.4f} "
+                  f"{values['loop_blocked_s']:>10.4f} {values['max_stall_s']:>12.4f} "
+                  f"{values['executor_jobs']:>10} {values['executor_busy_s']:>12.4f} "
+                  f"{values['executor_occupancy']:>10.4f}")
+
+
+async def _main(args: argparse.Namespace) -> None:
+    results = [await bench(entries) for entries in args.entries]
+    _print(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, nargs="+", default=list(DEFAULT_ENTRIES))
+    parser.add_argument("--json", help="also write the results to this file")
+    asyncio.run(_main(parser.parse_args()))
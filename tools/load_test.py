@@ -0,0 +1,319 @@
+"""Fleet load test of the integration against simulated devices.
+
+Serves N simulated dehumidifiers (tools/miio_simulator.py) from their own
+event loop in a separate thread, sets up one config entry per device and
+drives the real code paths of the integration:
+
+- polls: rounds of concurrent coordinator refreshes of every device
+- commands: humidifier.set_humidity service calls to every device
+
+and reports, per fleet size, the p50/p95/p99 poll and command latency,
+the commands per second, the executor queue depth, the event loop lag and
+the memory the integration allocated per device. The report is JSON, so the
+results of two releases can be diffed. Needs Home Assistant and
+pytest-homeassistant-custom-component, and binds the devices to
+127.0.x.y:54321, which Linux allows for the whole loopback network:
+
+    python tools/load_test.py --devices 10 100 1000 --json load.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from typing import Any, Dict, List, Optional, Sequence
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# the integration must be imported before the test helpers add theirs
+import custom_components.xiaomi_miio_humidifier  # noqa: E402  pylint: disable=wrong-import-position
+from homeassistant import loader  # noqa: E402
+from homeassistant.helpers import entity_registry as er  # noqa: E402
+from homeassistant.setup import async_setup_component  # noqa: E402
+from pytest_homeassistant_custom_component.common import (  # noqa: E402
+    MockConfigEntry,
+    async_test_home_assistant
+)
+
+from miio_simulator import MODELS, async_serve_fleet, fleet_address, fleet_token  # noqa: E402
+
+DOMAIN = "xiaomi_miio_humidifier"
+DEFAULT_DEVICES = (10, 100, 1000)
+DEFAULT_ROUNDS = 5
+DEFAULT_COMMANDS = 2
+# interval of the event loop lag and executor queue samples
+SAMPLE_INTERVAL = 0.01
+FIRST_POLL_TIMEOUT = 120
+
+
+class FleetThread(threading.Thread):
+    """Serve a simulated fleet from an event loop of its own."""
+
+    def __init__(self, count: int, **kwargs) -> None:
+        super().__init__(name="simulated-fleet", daemon=True)
+        self._count = count
+        self._kwargs = kwargs
+        self._ready = threading.Event()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.fleet = []
+
+    def run(self) -> None:
+        self.loop = asyncio.new_event_loop()
+        self.fleet = self.loop.run_until_complete(
+            async_serve_fleet(self._count, spread_hosts=True, **self._kwargs)
+        )
+        self._ready.set()
+        self.loop.run_forever()
+        for transport, _ in self.fleet:
+            transport.close()
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.loop.close()
+
+    def start(self) -> None:
+        super().start()
+        self._ready.wait()
+
+    def stop(self) -> None:
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.join()
+
+
+class Sampler:
+    """Sample the event loop lag and the executor queue depth."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop) -> None:
+        self.lags: List[float] = []
+        self.queue_depths: List[int] = []
+        self._loop = loop
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(SAMPLE_INTERVAL)
+            self.lags.append(max(0.0, time.perf_counter() - started - SAMPLE_INTERVAL))
+            executor = getattr(self._loop, "_default_executor", None)
+            queue = getattr(executor, "_work_queue", None)
+            self.queue_depths.append(queue.qsize() if queue is not None else 0)
+
+    def start(self) -> None:
+        self.lags.clear()
+        self.queue_depths.clear()
+        self._task = self._loop.create_task(self._run())
+
+    def stop(self) -> Dict[str, Any]:
+        """Stop sampling and summarize the samples."""
+        self._task.cancel()
+        return {
+            "loop_lag_s": percentiles(self.lags),
+            "executor_queue": {
+                "max": max(self.queue_depths, default=0),
+                "mean": round(statistics.fmean(self.queue_depths), 4)
+                if self.queue_depths else 0,
+            },
+        }
+
+
+def percentiles(samples: Sequence[float]) -> Dict[str, float]:
+    """Return the p50, p95, p99 and max of samples."""
+    if len(samples) < 2:
+        value = round(samples[0], 6) if samples else 0.0
+        return {"p50": value, "p95": value, "p99": value, "max": value}
+
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return {
+        "p50": round(cuts[49], 6),
+        "p95": round(cuts[94], 6),
+        "p99": round(cuts[98], 6),
+        "max": round(max(samples), 6),
+    }
+
+
+async def _timed(coro, latencies: List[float]) -> bool:
+    """Await a coroutine and record its latency, return whether it succeeded."""
+    started = time.perf_counter()
+    try:
+        await coro
+    except Exception:  # pylint: disable=broad-except
+        return False
+    finally:
+        latencies.append(time.perf_counter() - started)
+    return True
+
+
+async def _wait_first_poll(coordinators) -> None:
+    """Wait until every coordinator polled its device."""
+    deadline = time.monotonic() + FIRST_POLL_TIMEOUT
+    while time.monotonic() < deadline:
+        if all(c.data is not None and not c.stale for c in coordinators):
+            return
+        await asyncio.sleep(SAMPLE_INTERVAL)
+
+    raise TimeoutError("The first poll did not finish in time")
+
+
+async def run(devices: int, rounds: int, commands: int, models: Sequence[str],
+              simulator: Dict[str, Any]) -> Dict[str, Any]:
+    """Load a fleet of devices and return its report."""
+    report: Dict[str, Any] = {"devices": devices}
+    fleet = FleetThread(devices, models=models, **simulator)
+    fleet.start()
+    try:
+        with tempfile.TemporaryDirectory() as storage_dir:
+            async with async_test_home_assistant(storage_dir=storage_dir) as hass:
+                hass.data.pop(loader.DATA_CUSTOM_COMPONENTS, None)
+                hosts = []
+                for index in range(devices):
+                    host, _ = fleet_address(index, "", 0, True)
+                    hosts.append(host)
+                    MockConfigEntry(
+                        domain=DOMAIN,
+                        title=f"Dehumidifier {index}",
+                        unique_id=f"load-{index}",
+                        data={"config_flow_device": "device", "host": host,
+                              "token": fleet_token(index),
+                              "model": models[index % len(models)]},
+                    ).add_to_hass(hass)
+
+                sampler = Sampler(hass.loop)
+                try:
+                    tracemalloc.start()
+                    baseline = tracemalloc.get_traced_memory()[0]
+                    assert await async_setup_component(hass, DOMAIN, {})
+                    await hass.async_block_till_done()
+                    coordinators = [hass.data[DOMAIN][host]["coordinator"] for host in hosts]
+                    await _wait_first_poll(coordinators)
+                    allocated = tracemalloc.get_traced_memory()[0] - baseline
+                    tracemalloc.stop()
+                    report["memory_per_device_bytes"] = allocated // devices
+
+                    latencies: List[float] = []
+                    failures = 0
+                    sampler.start()
+                    started = time.perf_counter()
+                    for _ in range(rounds):
+                        # a refresh logs its errors instead of raising them
+                        await asyncio.gather(*(
+                            _timed(coordinator.async_refresh(), latencies)
+                            for coordinator in coordinators
+                        ))
+                        failures += sum(
+                            1 for coordinator in coordinators
+                            if not coordinator.last_update_success
+                        )
+                    wall = time.perf_counter() - started
+                    report["polls"] = {
+                        "count": len(latencies),
+                        "failed": failures,
+                        "per_s": round(len(latencies) / wall, 2) if wall else 0,
+                        "latency_s": percentiles(latencies),
+                        **sampler.stop(),
+                    }
+
+                    registry = er.async_get(hass)
+                    entity_ids = [
+                        entity.entity_id for entity in registry.entities.values()
+                        if entity.platform == DOMAIN and entity.domain == "humidifier"
+                    ]
+                    latencies = []
+                    failures = 0
+                    sampler.start()
+                    started = time.perf_counter()
+                    for step in range(commands):
+                        results = await asyncio.gather(*(
+                            _timed(hass.services.async_call(
+                                "humidifier", "set_humidity",
+                                {"entity_id": entity_id, "humidity": 45 + step % 2 * 5},
+                                blocking=True
+                            ), latencies)
+                            for entity_id in entity_ids
+                        ))
+                        failures += results.count(False)
+                    wall = time.perf_counter() - started
+                    report["commands"] = {
+                        "count": len(latencies),
+                        "failed": failures,
+                        "per_s": round(len(latencies) / wall, 2) if wall else 0,
+                        "latency_s": percentiles(latencies),
+                        **sampler.stop(),
+                    }
+
+                    await asyncio.gather(*(
+                        hass.config_entries.async_unload(entry.entry_id)
+                        for entry in hass.config_entries.async_entries(DOMAIN)
+                    ))
+                finally:
+                    if tracemalloc.is_tracing():
+                        tracemalloc.stop()
+                    await hass.async_stop(force=True)
+    finally:
+        fleet.stop()
+
+    report["simulator"] = {
+        "dropped": sum(device.dropped for _, device in fleet.fleet),
+        "faults": sum(device.faults for _, device in fleet.fleet),
+    }
+    return report
+
+
+def _print(reports: List[Dict[str, Any]]) -> None:
+    """Print the reports as a table."""
+    print(f"{'devices':>8} {'path':<9} {'count':>7} {'failed':>7} {'per s':>9} "
+          f"{'p50 s':>9} {'p95 s':>9} {'p99 s':>9} {'lag p99 s':>10} {'queue max':>10}")
+    for report in reports:
+        for path in ("polls", "commands"):
+            values = report[path]
+            latency = values["latency_s"]
+            print(f"{report['devices']:>8} {path:<9} {values['count']:>7} "
+                  f"{values['failed']:>7} {values['per_s']:>9.2f} {latency['p50']:>9.4f} "
+                  f"{latency['p95']:>9.4f} {latency['p99']:>9.4f} "
+                  f"{values['loop_lag_s']['p99']:>10.4f} {values['executor_queue']['max']:>10}")
+        print(f"{report['devices']:>8} memory per device: "
+              f"{report['memory_per_device_bytes']} bytes")
+
+
+async def _main(args: argparse.Namespace) -> None:
+    simulator = {
+        "latency": args.latency,
+        "jitter": args.jitter,
+        "loss": args.loss,
+        "fault_rate": args.fault_rate,
+        "seed": args.seed,
+    }
+    reports = [
+        await run(devices, args.rounds, args.commands, args.model or MODELS, simulator)
+        for devices in args.devices
+    ]
+    _print(reports)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(reports, file, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--devices", type=int, nargs="+", default=list(DEFAULT_DEVICES),
+                        help="fleet sizes, up to 1000 devices")
+    parser.add_argument("--rounds", type=int, default=DEFAULT_ROUNDS,
+                        help="polls of every device")
+    parser.add_argument("--commands", type=int, default=DEFAULT_COMMANDS,
+                        help="commands to every device")
+    parser.add_argument("--model", action="append", choices=MODELS,
+                        help="model of the devices, repeat to mix models")
+    parser.add_argument("--latency", type=float, default=0.0, help="reply delay in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0,
+                        help="random extra delay up to this many seconds")
+    parser.add_argument("--loss", type=float, default=0.0,
+                        help="probability of dropping a request")
+    parser.add_argument("--fault-rate", type=float, default=0.0,
+                        help="probability of an error reply")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the report to this file")
+    asyncio.run(_main(parser.parse_args()))
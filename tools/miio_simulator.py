@@ -0,0 +1,276 @@
+"""Local miIO/MIoT simulator of the supported dehumidifiers.
+
+Builds on the stand-in device (tools/miio_stand_in.py): each simulated
+device serves the MIOT_MAPPING properties and actions of its model over the
+encrypted miIO protocol, lets the room humidity and temperature drift with
+its power state and mode, and can add latency, jitter, packet loss and
+error replies. Many devices can run side by side, either on consecutive
+ports of one address or, for the integration which always talks to port
+54321, on one loopback address each:
+
+    python tools/miio_simulator.py --count 50 --model dmaker.derh.22l --spread-hosts
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import time
+from typing import Any, Iterable, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# pylint: disable=wrong-import-position
+from custom_components.xiaomi_miio_humidifier.humidifier_miot import (  # noqa: E402
+    MIOT_MAPPING,
+    PowerMode_V1
+)
+from miio_stand_in import MiioStandInDevice, StandInError, async_serve  # noqa: E402
+
+MODELS = tuple(MIOT_MAPPING)
+
+INITIAL_VALUES = {
+    "status": True,
+    "device_fault": 0,
+    "mode": PowerMode_V1.Smart.value,
+    "target_humidity": 50,
+    "relative_humidity": 65,
+    "temperature": 25,
+    "alarm": True,
+    "indicator_light": True,
+    "light_mode": 0,
+    "physical_controls_locked": False,
+    "off_delay_time": 0,
+    "dry_after_off": True,
+    "dry_left_time": 0,
+    "is_warming_up": False,
+}
+
+# humidity of the room the dehumidifier works against, in %
+AMBIENT_HUMIDITY = 70.0
+# change of the humidity in % per minute, while drying and while off
+DRY_RATE = {
+    PowerMode_V1.Smart.value: 1.0,
+    PowerMode_V1.Sleep.value: 0.5,
+    PowerMode_V1.Clothes_Drying.value: 2.0,
+}
+RISE_RATE = 0.3
+# minutes the device keeps drying itself after it was turned off
+DRY_AFTER_OFF_TIME = 120
+WARM_UP_TIME = 60
+TEMPERATURE_RANGE = (15.0, 35.0)
+RECOVERABLE_ERROR = (-9999, "user ack timeout")
+
+
+class SimulatedDehumidifier(MiioStandInDevice):
+    """A dehumidifier of one model, with a drifting room and an unreliable network."""
+
+    def __init__(
+        self,
+        model: str = MODELS[0],
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        loss: float = 0.0,
+        fault_rate: float = 0.0,
+        seed: Optional[int] = None,
+        **kwargs
+    ) -> None:
+        """Initialize the device."""
+        mapping = MIOT_MAPPING[model]
+        self._keys = {name: (ids["siid"], ids["piid"]) for name, ids in mapping.items()
+                      if "piid" in ids}
+        self._actions = {(ids["siid"], ids["aiid"]): name for name, ids in mapping.items()
+                         if "aiid" in ids}
+        super().__init__(
+            model=model,
+            properties={key: INITIAL_VALUES[name] for name, key in self._keys.items()},
+            **kwargs
+        )
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.fault_rate = fault_rate
+        self.dropped = 0
+        self.faults = 0
+        self._random = random.Random(seed)
+        self._humidity = float(INITIAL_VALUES["relative_humidity"])
+        self._temperature = float(INITIAL_VALUES["temperature"])
+        self._updated_at = time.monotonic()
+        self._dry_until = 0.0
+        self._warm_until = 0.0
+
+    def datagram_received(self, data: bytes, addr: Tuple[str, int]) -> None:
+        """Drop or delay a request before answering it."""
+        if self.loss and self._random.random() < self.loss:
+            self.dropped += 1
+            return
+
+        delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay > 0:
+            asyncio.get_running_loop().call_later(
+                delay, super().datagram_received, data, addr
+            )
+        else:
+            super().datagram_received(data, addr)
+
+    def handle(self, method: str, params: Any) -> Any:
+        """Answer a command from the simulated state, or fail it."""
+        if self.fault_rate and self._random.random() < self.fault_rate:
+            self.faults += 1
+            raise StandInError(*RECOVERABLE_ERROR)
+
+        self._advance()
+        was_on = self._get("status")
+        if method == "action":
+            result = super().handle(method, params)
+            self._run_action(self._actions.get((params["siid"], params["aiid"])))
+        else:
+            result = super().handle(method, params)
+        self._power_changed(was_on)
+        return result
+
+    def _get(self, name: str) -> Any:
+        """Return the value of a property of the model."""
+        key = self._keys.get(name)
+        return None if key is None else self.properties[key]
+
+    def _set(self, name: str, value: Any) -> None:
+        """Set a property if the model has it."""
+        key = self._keys.get(name)
+        if key is not None:
+            self.properties[key] = value
+
+    def _run_action(self, name: Optional[str]) -> None:
+        """Apply the effect of an action."""
+        if name == "toggle":
+            self._set("status", not self._get("status"))
+        elif name == "loop-mode":
+            self._set("mode", (self._get("mode") + 1) % len(PowerMode_V1))
+
+    def _power_changed(self, was_on: bool) -> None:
+        """Start the warm up or the drying after off on a power change."""
+        now = time.monotonic()
+        is_on = self._get("status")
+        if is_on and not was_on:
+            self._warm_until = now + WARM_UP_TIME
+            self._dry_until = 0.0
+        elif was_on and not is_on and self._get("dry_after_off"):
+            self._dry_until = now + DRY_AFTER_OFF_TIME * 60
+        self._update_timers(now)
+
+    def _update_timers(self, now: float) -> None:
+        """Publish the warm up and the remaining dry time."""
+        self._set("is_warming_up", now < self._warm_until)
+        self._set("dry_left_time", max(0, int((self._dry_until - now + 59) // 60)))
+
+    def _advance(self) -> None:
+        """Let the room drift for the time since the last request."""
+        now = time.monotonic()
+        minutes = (now - self._updated_at) / 60
+        self._updated_at = now
+        if self._get("status"):
+            target = self._get("target_humidity")
+            rate = DRY_RATE.get(self._get("mode"), DRY_RATE[PowerMode_V1.Smart.value])
+            self._humidity = max(target - 1, self._humidity - rate * minutes)
+        else:
+            self._humidity = min(AMBIENT_HUMIDITY, self._humidity + RISE_RATE * minutes)
+
+        self._humidity = min(100.0, max(0.0, self._humidity + self._random.gauss(0, 0.2)))
+        self._temperature = min(
+            TEMPERATURE_RANGE[1],
+            max(TEMPERATURE_RANGE[0], self._temperature + self._random.gauss(0, 0.05))
+        )
+        self._set("relative_humidity", round(self._humidity))
+        self._set("temperature", round(self._temperature))
+        self._update_timers(now)
+
+
+def fleet_address(index: int, host: str, base_port: int, spread_hosts: bool) -> Tuple[str, int]:
+    """Return the address of the n-th device of a fleet."""
+    if spread_hosts:
+        return f"127.0.{index // 250}.{index % 250 + 1}", 54321
+    return host, base_port + index if base_port else 0
+
+
+def fleet_token(index: int) -> str:
+    """Return the token of the n-th device of a fleet."""
+    return f"{index + 1:032x}"
+
+
+async def async_serve_fleet(
+    count: int,
+    models: Iterable[str] = MODELS,
+    host: str = "127.0.0.1",
+    base_port: int = 0,
+    spread_hosts: bool = False,
+    seed: Optional[int] = None,
+    **kwargs
+) -> List[Tuple[asyncio.DatagramTransport, SimulatedDehumidifier]]:
+    """Serve a fleet of devices, the models are used in turn."""
+    models = list(models)
+    fleet = []
+    for index in range(count):
+        device_host, port = fleet_address(index, host, base_port, spread_hosts)
+        fleet.append(await async_serve(
+            device_host,
+            port,
+            device_class=SimulatedDehumidifier,
+            model=models[index % len(models)],
+            token=fleet_token(index),
+            device_id=index + 1,
+            seed=None if seed is None else seed + index,
+            **kwargs
+        ))
+
+    return fleet
+
+
+async def _main(args: argparse.Namespace) -> None:
+    """Serve a fleet until interrupted."""
+    fleet = await async_serve_fleet(
+        args.count,
+        args.model or MODELS,
+        host=args.host,
+        base_port=args.base_port,
+        spread_hosts=args.spread_hosts,
+        seed=args.seed,
+        latency=args.latency,
+        jitter=args.jitter,
+        loss=args.loss,
+        fault_rate=args.fault_rate,
+    )
+    for transport, device in fleet:
+        host, port = transport.get_extra_info("sockname")[:2]
+        print(f"{host}:{port} {device.model} {device.token.hex()}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        for transport, _ in fleet:
+            transport.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=1)
+    parser.add_argument("--model", action="append", choices=MODELS,
+                        help="model of the devices, repeat to mix models")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--base-port", type=int, default=54321,
+                        help="port of the first device, 0 picks free ports")
+    parser.add_argument("--spread-hosts", action="store_true",
+                        help="one loopback address per device, all on port 54321")
+    parser.add_argument("--latency", type=float, default=0.0, help="reply delay in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0,
+                        help="random extra delay up to this many seconds")
+    parser.add_argument("--loss", type=float, default=0.0,
+                        help="probability of dropping a request")
+    parser.add_argument("--fault-rate", type=float, default=0.0,
+                        help="probability of an error reply")
+    parser.add_argument("--seed", type=int)
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(_main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,195 @@
+"""Local UDP stand-in for a miIO dehumidifier.
+
+Answers the miIO handshake and the MIoT commands used by the component
+(get_properties, set_properties, action and miIO.info) from an in-memory
+property table, so the asyncio transport can be exercised without hardware:
+
+    python tools/miio_stand_in.py --port 54321 --token 00000000000000000000000000000000
+"""
+import argparse
+import asyncio
+import logging
+import struct
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple, Type
+
+from miio.protocol import Message
+
+_LOGGER = logging.getLogger(__name__)
+
+HELLO_BYTES = bytes.fromhex(
+    "21310020ffffffffffffffffffffffffffffffffffffffffffffffffffffffff"
+)
+DEFAULT_TOKEN = 32 * "0"
+DEFAULT_DEVICE_ID = 0x1234ABCD
+
+# siid, piid and value of the dmaker.derh.22ht properties
+DEFAULT_PROPERTIES = {
+    (2, 1): True,   # status
+    (2, 2): 0,      # device_fault
+    (2, 3): 0,      # mode
+    (2, 5): 50,     # target_humidity
+    (3, 1): 60,     # relative_humidity
+    (3, 2): 25,     # temperature
+    (4, 1): True,   # alarm
+    (5, 1): True,   # indicator_light
+    (5, 2): 0,      # light_mode
+    (6, 1): False,  # physical_controls_locked
+    (7, 1): 0,      # off_delay_time
+    (7, 2): True,   # dry_after_off
+    (7, 3): 0,      # dry_left_time
+    (7, 4): False,  # is_warming_up
+}
+
+
+class StandInError(Exception):
+    """An error reply of the device."""
+
+    def __init__(self, code: int, message: str) -> None:
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+class MiioStandInDevice(asyncio.DatagramProtocol):
+    """A miIO device answering from a property table."""
+
+    def __init__(
+        self,
+        token: str = DEFAULT_TOKEN,
+        device_id: int = DEFAULT_DEVICE_ID,
+        model: str = "dmaker.derh.22ht",
+        properties: Optional[Dict[Tuple[int, int], Any]] = None
+    ) -> None:
+        """Initialize the device."""
+        self.token = bytes.fromhex(token)
+        self.device_id = device_id
+        self.model = model
+        self.properties = dict(DEFAULT_PROPERTIES if properties is None else properties)
+        self.requests = []
+        self.handshakes = 0
+        self.transport: Optional[asyncio.DatagramTransport] = None
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        """Keep the transport of the bound socket."""
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr: Tuple[str, int]) -> None:
+        """Answer a handshake or a command."""
+        if data == HELLO_BYTES:
+            self.handshakes += 1
+            self.transport.sendto(self._hello_reply(), addr)
+            return
+
+        try:
+            request = Message.parse(data, token=self.token).data.value
+        except Exception as ex:  # pylint: disable=broad-except
+            _LOGGER.warning("Unable to parse request from %s: %s", addr, ex)
+            return
+
+        self.requests.append(request)
+        reply = {"id": request["id"]}
+        try:
+            reply["result"] = self.handle(request["method"], request.get("params"))
+        except StandInError as ex:
+            reply["error"] = {"code": ex.code, "message": ex.message}
+
+        self.transport.sendto(self._build(reply), addr)
+
+    def handle(self, method: str, params: Any) -> Any:
+        """Return the result of a command."""
+        if method == "get_properties":
+            return [self._get_property(prop) for prop in params]
+        if method == "set_properties":
+            return [self._set_property(prop) for prop in params]
+        if method == "action":
+            return {"did": params.get("did"), "siid": params["siid"], "aiid": params["aiid"],
+                    "code": 0, "out": []}
+        if method == "miIO.info":
+            return {
+                "model": self.model,
+                "fw_ver": "1.0.0",
+                "hw_ver": "esp32",
+                "mac": "02:00:00:00:00:01",
+                "token": self.token.hex(),
+                "life": 1,
+                "ap": {"ssid": "stand-in", "bssid": "02:00:00:00:00:02", "rssi": -50},
+                "netif": {"localIp": "127.0.0.1", "mask": "255.0.0.0", "gw": "127.0.0.1"},
+            }
+
+        raise StandInError(-32601, f"Method not found: {method}")
+
+    def _get_property(self, prop: Dict[str, Any]) -> Dict[str, Any]:
+        """Return the value of a property, or the code of an unknown one."""
+        key = (prop["siid"], prop["piid"])
+        if key not in self.properties:
+            return {**prop, "code": -4003}
+
+        return {**prop, "code": 0, "value": self.properties[key]}
+
+    def _set_property(self, prop: Dict[str, Any]) -> Dict[str, Any]:
+        """Set the value of a property."""
+        key = (prop["siid"], prop["piid"])
+        result = {"did": prop.get("did"), "siid": prop["siid"], "piid": prop["piid"]}
+        if key not in self.properties:
+            return {**result, "code": -4003}
+
+        self.properties[key] = prop["value"]
+        return {**result, "code": 0}
+
+    def _hello_reply(self) -> bytes:
+        """Return the handshake reply carrying the device id and timestamp."""
+        stamp = int(time.time())
+        return struct.pack(">HHIII", 0x2131, 32, 0, self.device_id, stamp) + 16 * b"\xff"
+
+    def _build(self, reply: Dict[str, Any]) -> bytes:
+        """Encrypt a reply with the token of the device."""
+        header = {
+            "length": 0,
+            "unknown": 0,
+            "device_id": struct.pack(">I", self.device_id),
+            "ts": datetime.utcnow(),
+        }
+        return Message.build(
+            {"data": {"value": reply}, "header": {"value": header}, "checksum": 0},
+            token=self.token
+        )
+
+
+async def async_serve(
+    host: str = "127.0.0.1",
+    port: int = 0,
+    device_class: Type[MiioStandInDevice] = MiioStandInDevice,
+    **kwargs
+) -> Tuple[asyncio.DatagramTransport, MiioStandInDevice]:
+    """Serve a stand-in device, port 0 picks a free port."""
+    loop = asyncio.get_running_loop()
+    return await loop.create_datagram_endpoint(
+        lambda: device_class(**kwargs), local_addr=(host, port)
+    )
+
+
+async def _main(args: argparse.Namespace) -> None:
+    """Serve until interrupted."""
+    transport, _ = await async_serve(
+        args.host, args.port, token=args.token, model=args.model
+    )
+    _LOGGER.info("Serving %s on %s", args.model, transport.get_extra_info("sockname"))
+    try:
+        await asyncio.Event().wait()
+    finally:
+        transport.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=54321)
+    parser.add_argument("--token", default=DEFAULT_TOKEN)
+    parser.add_argument("--model", default="dmaker.derh.22ht")
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(_main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass